@@ -1,8 +1,10 @@
 from flask import Flask, request, jsonify, abort
 
+from greetings_store import store_from_env
+
 app = Flask(__name__)
 
-greetings = {
+DEFAULT_GREETINGS = {
             'en': 'hello', 
             'es': 'Hola', 
             'ar': 'مرحبا',
@@ -12,22 +14,29 @@ greetings = {
             'ja': 'こんにちは'
             }
 
+# in memory by default; set GREETINGS_DB to a file path to share the
+# greetings between worker processes and keep them across restarts
+greetings = store_from_env(DEFAULT_GREETINGS)
+
 @app.route('/greeting', methods=['GET'])
 def greeting_all():
-    return jsonify({'greetings': greetings})
+    return jsonify({'greetings': greetings.all()})
 
 @app.route('/greeting/<lang>', methods=['GET'])
 def greeting_one(lang):
     print(lang)
-    if(lang not in greetings):
+    greeting = greetings.get(lang)
+    if(greeting is None):
         abort(404)
-    return jsonify({'greeting': greetings[lang
-    ]})
+    return jsonify({'greeting': greeting})
 
 @app.route('/greeting', methods=['POST'])
 def greeting_add():
     info = request.get_json()
-    if('lang' not in info or 'greeting' not in info):
+    if(not isinstance(info, dict) or 'lang' not in info or 'greeting' not in info):
+        abort(422)
+    try:
+        greetings.set(info['lang'], info['greeting'])
+    except ValueError:
         abort(422)
-    greetings[info['lang']] = info['greeting']
-    return jsonify({'greetings':greetings})
+    return jsonify({'greetings':greetings.all()})
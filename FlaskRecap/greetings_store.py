@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+
+'''
+Greeting stores
+
+Both stores accept the same greetings: set() raises ValueError for a lang
+that is not a non-empty string or a greeting that is not a string, before
+anything is written.
+
+Both stores keep the greetings in a dict snapshot that is replaced, never
+mutated, on every change. all() and get() read whichever snapshot is
+current without taking a lock; set() builds the next one.
+'''
+
+
+def _check(lang, greeting):
+    # checked up front, where SQLiteStore's NOT NULL column would only
+    # reject a None greeting once the write had started
+    if not isinstance(lang, str) or lang == '':
+        raise ValueError('lang must be a non-empty string')
+    if not isinstance(greeting, str):
+        raise ValueError('greeting must be a string')
+
+
+class MemoryStore:
+    '''
+    greetings held in this process only: lost on restart and not shared
+    between gunicorn workers. The default, fine for the flask dev server.
+    '''
+    def __init__(self, initial):
+        self._write_lock = threading.Lock()
+        self._snapshot = dict(initial)
+
+    def all(self):
+        return self._snapshot
+
+    def get(self, lang):
+        return self._snapshot.get(lang)
+
+    def set(self, lang, greeting):
+        _check(lang, greeting)
+        with self._write_lock:
+            snapshot = dict(self._snapshot)
+            snapshot[lang] = greeting
+            self._snapshot = snapshot
+
+
+class SQLiteStore:
+    '''
+    greetings persisted in a SQLite database in WAL mode, so writes survive
+    restarts and every worker process sees them. Each process serves reads
+    from its own snapshot and reloads it only when PRAGMA data_version shows
+    another connection has committed since the last load. Under WAL that
+    check reads shared memory and never waits on a writer.
+    '''
+    def __init__(self, path, initial, busy_timeout=5000):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._reload_lock = threading.Lock()
+        self._snapshot = {}
+
+        conn = self._connect()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS greetings ('
+                         'lang TEXT PRIMARY KEY, greeting TEXT NOT NULL)')
+            conn.executemany('INSERT OR IGNORE INTO greetings (lang, greeting) VALUES (?, ?)',
+                             initial.items())
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # a commit is on disk before set() returns
+        conn.execute('PRAGMA synchronous=FULL')
+        return conn
+
+    def _connection(self):
+        # one connection per thread, opened again in a forked worker
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+            self._local.version = None
+        return conn
+
+    def _current(self):
+        conn = self._connection()
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if version != getattr(self._local, 'version', None):
+            self._reload(conn)
+            self._local.version = version
+        return self._snapshot
+
+    def _reload(self, conn):
+        with self._reload_lock:
+            self._snapshot = dict(conn.execute('SELECT lang, greeting FROM greetings').fetchall())
+
+    def all(self):
+        return self._current()
+
+    def get(self, lang):
+        return self._current().get(lang)
+
+    def set(self, lang, greeting):
+        _check(lang, greeting)
+        conn = self._connection()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO greetings (lang, greeting) VALUES (?, ?)',
+                         (lang, greeting))
+        # data_version ignores this connection's own commits, so reload now
+        self._reload(conn)
+
+
+def store_from_env(initial, environ=os.environ):
+    '''
+    a SQLiteStore at $GREETINGS_DB when it is set, a MemoryStore otherwise
+    '''
+    path = environ.get('GREETINGS_DB')
+    if path:
+        return SQLiteStore(path, initial)
+    return MemoryStore(initial)
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+
+import FlaskRecap
+from FlaskRecap import app, DEFAULT_GREETINGS
+from greetings_store import MemoryStore, SQLiteStore
+
+# the same requests for every store: (method, path, json body)
+REQUESTS = [
+    ('GET', '/greeting', None),
+    ('GET', '/greeting/en', None),
+    ('GET', '/greeting/xx', None),
+    ('POST', '/greeting', {'lang': 'de', 'greeting': 'Hallo'}),
+    ('GET', '/greeting/de', None),
+    ('POST', '/greeting', {'lang': 'de', 'greeting': None}),
+    ('POST', '/greeting', {'lang': 'it', 'greeting': None}),
+    ('GET', '/greeting/it', None),
+    ('POST', '/greeting', {'lang': '', 'greeting': 'hi'}),
+    ('POST', '/greeting', {'lang': 7, 'greeting': 'hi'}),
+    ('POST', '/greeting', {'greeting': 'hi'}),
+    ('POST', '/greeting', ['en', 'hello']),
+    ('GET', '/greeting', None),
+]
+
+
+class GreetingsTestCase(unittest.TestCase):
+    """This class represents the greetings test case, run against both stores"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.default_store = FlaskRecap.greetings
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.client = app.test_client
+
+    def tearDown(self):
+        FlaskRecap.greetings = self.default_store
+        self.tempdir.cleanup()
+
+    def stores(self):
+        return {
+            'memory': MemoryStore(DEFAULT_GREETINGS),
+            'sqlite': SQLiteStore(os.path.join(self.tempdir.name, 'greetings.db'), DEFAULT_GREETINGS),
+        }
+
+    def play(self, store):
+        FlaskRecap.greetings = store
+        responses = []
+        for method, path, body in REQUESTS:
+            res = self.client().open(path, method=method, json=body)
+            responses.append((method, path, res.status_code, res.get_json()))
+        return responses
+
+    # test_null_greeting
+    def test_null_greeting(self):
+        for name, store in self.stores().items():
+            with self.subTest(store=name):
+                FlaskRecap.greetings = store
+                res = self.client().post('/greeting', json={'lang': 'it', 'greeting': None})
+
+                self.assertEqual(res.status_code, 422)
+                self.assertIsNone(store.get('it'))
+                self.assertEqual(self.client().get('/greeting/it').status_code, 404)
+
+    # test_stores_agree
+    def test_stores_agree(self):
+        stores = self.stores()
+        memory = self.play(stores['memory'])
+        sqlite = self.play(stores['sqlite'])
+
+        self.assertEqual(memory, sqlite)
+        self.assertEqual([status for _, _, status, _ in memory],
+                         [200, 200, 404, 200, 200, 422, 422, 404, 422, 422, 422, 422, 200])
+        self.assertEqual(memory[-1][3]['greetings']['de'], 'Hallo')
+
+    # test_set_rejects_before_writing
+    def test_set_rejects_before_writing(self):
+        for name, store in self.stores().items():
+            with self.subTest(store=name):
+                for lang, greeting in (('it', None), ('', 'ciao'), (None, 'ciao'), ('it', 3)):
+                    with self.assertRaises(ValueError):
+                        store.set(lang, greeting)
+                self.assertEqual(store.all(), DEFAULT_GREETINGS)
+
+    # test_sqlite_stores_share_file
+    def test_sqlite_stores_share_file(self):
+        path = os.path.join(self.tempdir.name, 'greetings.db')
+        writer = SQLiteStore(path, DEFAULT_GREETINGS)
+        reader = SQLiteStore(path, DEFAULT_GREETINGS)
+        self.assertEqual(reader.all(), DEFAULT_GREETINGS)
+
+        writer.set('de', 'Hallo')
+        writer.set('en', 'Hi there')
+
+        # the reader has a snapshot already and must notice the other connection's commits
+        self.assertEqual(reader.get('de'), 'Hallo')
+        self.assertEqual(reader.get('en'), 'Hi there')
+
+        # reopened with the defaults, which must not overwrite what was written
+        reopened = SQLiteStore(path, DEFAULT_GREETINGS)
+        expected = dict(DEFAULT_GREETINGS, de='Hallo', en='Hi there')
+        self.assertEqual(reopened.all(), expected)
+        self.assertEqual(reader.all(), expected)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,8 @@
+'''
+fsnd_common
+    helpers shared by the projects in this repository, installed as a
+    package by each project's requirements.txt (pip install -e of the
+    repository root) and imported from there, e.g.
+
+        from fsnd_common.database import configure_database
+'''
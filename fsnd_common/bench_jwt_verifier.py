@@ -0,0 +1,99 @@
+'''
+Throughput benchmark for JWTVerifier.
+
+    python -m fsnd_common.bench_jwt_verifier [tokens] [kids]
+
+run from the repository root, so that fsnd_common is importable.
+
+Generates an RSA keypair locally, publishes it as a JWKS file among `kids`
+decoy keys and signs `tokens` distinct access tokens with it. It then
+verifies them the way verify_decode_jwt used to (urlopen the JWKS, scan
+jwks['keys'] for the kid, jwt.decode with the rebuilt dict) and with a
+JWTVerifier over a JWKSStore, reporting tokens/sec for each.
+'''
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+from urllib.request import urlopen
+
+from jose import jwt
+
+from fsnd_common.jwks import JWKSStore, file_source
+from fsnd_common.jwt_verifier import JWTVerifier
+
+ISSUER = 'https://bench.example.com/'
+AUDIENCE = 'bench'
+
+
+def _b64(number):
+    raw = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def generate_keypair(bits=2048):
+    # (private key PEM, public n, public e) from pycryptodome when it is
+    # installed (as pinned in the projects), else from the rsa package
+    try:
+        from Crypto.PublicKey import RSA
+        key = RSA.generate(bits)
+        return key.exportKey('PEM').decode(), key.n, key.e
+    except ImportError:
+        import rsa
+        public, private = rsa.newkeys(bits)
+        return private.save_pkcs1().decode(), public.n, public.e
+
+
+def legacy_verify(token, jwks_url):
+    jsonurl = urlopen(jwks_url)
+    jwks = json.loads(jsonurl.read())
+    unverified_header = jwt.get_unverified_header(token)
+    rsa_key = {}
+    for key in jwks['keys']:
+        if key['kid'] == unverified_header['kid']:
+            rsa_key = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key['use'],
+                'n': key['n'],
+                'e': key['e']
+            }
+    return jwt.decode(token, rsa_key, algorithms=['RS256'], audience=AUDIENCE, issuer=ISSUER)
+
+
+def throughput(verify, tokens):
+    start = time.perf_counter()
+    for token in tokens:
+        verify(token)
+    return len(tokens) / (time.perf_counter() - start)
+
+
+def main(count=500, kids=20):
+    pem, n, e = generate_keypair()
+    keys = [{'kty': 'RSA', 'kid': 'decoy-{}'.format(i), 'use': 'sig', 'n': _b64(n + 2 * i + 2), 'e': _b64(e)}
+            for i in range(kids)]
+    keys.append({'kty': 'RSA', 'kid': 'bench', 'use': 'sig', 'n': _b64(n), 'e': _b64(e)})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'jwks.json')
+        with open(path, 'w') as f:
+            json.dump({'keys': keys}, f)
+
+        exp = int(time.time()) + 3600
+        tokens = [jwt.encode({'sub': 'user-{}'.format(i), 'aud': AUDIENCE, 'iss': ISSUER, 'exp': exp},
+                             pem, algorithm='RS256', headers={'kid': 'bench'})
+                  for i in range(count)]
+        verifier = JWTVerifier(JWKSStore(file_source(path), background=False), AUDIENCE, ISSUER)
+        jwks_url = 'file://' + path
+        for token in tokens[:5]:
+            assert legacy_verify(token, jwks_url) == verifier.verify(token)
+
+        print('{} tokens, {} keys in the JWKS'.format(count, len(keys)))
+        print('{:<22} {:>10.0f} tokens/sec'.format('verify_decode_jwt', throughput(lambda t: legacy_verify(t, jwks_url), tokens)))
+        print('{:<22} {:>10.0f} tokens/sec'.format('JWTVerifier.verify', throughput(verifier.verify, tokens)))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+
+from flask import jsonify
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+'''
+Environment variables read by engine_options(); every one is optional.
+
+    DB_POOL_SIZE            connections kept open per process (5)
+    DB_MAX_OVERFLOW         extra connections allowed under load (10)
+    DB_POOL_TIMEOUT         seconds to wait for a free connection (30)
+    DB_POOL_RECYCLE         seconds before a connection is replaced (1800)
+    DB_POOL_PRE_PING        1 to test connections on checkout (1)
+    DB_STATEMENT_TIMEOUT    PostgreSQL statement_timeout in ms, 0 for none (0)
+    DB_POOL_METRICS         1 to serve pool_metrics() at /_db/pool (0)
+
+Each gunicorn worker has its own pool, so a deployment holds at most
+workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+'''
+DEFAULTS = {
+    'DB_POOL_SIZE': 5,
+    'DB_MAX_OVERFLOW': 10,
+    'DB_POOL_TIMEOUT': 30,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_POOL_PRE_PING': 1,
+    'DB_STATEMENT_TIMEOUT': 0,
+    'DB_POOL_METRICS': 0,
+}
+
+
+def _setting(environ, name):
+    value = environ.get(name)
+    if value in (None, ''):
+        return DEFAULTS[name]
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('{} must be an integer, got {!r}'.format(name, value))
+
+
+'''
+InstrumentedQueuePool
+    a QueuePool that times how long each checkout waits for a connection.
+    The wait covers queueing behind other requests when the pool and its
+    overflow are exhausted, plus opening a new connection.
+'''
+class InstrumentedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool; keep counting across it
+        pool = super().recreate()
+        pool.checkouts = self.checkouts
+        pool.timeouts = self.timeouts
+        pool.wait_total = self.wait_total
+        pool.wait_max = self.wait_max
+        return pool
+
+
+'''
+engine_options(database_uri, environ)
+    create_engine() keyword arguments for database_uri, sized from the
+    DB_* environment variables. SQLite databases get none: their pools are
+    chosen by SQLAlchemy and a file database has nothing to size.
+'''
+def engine_options(database_uri, environ=os.environ):
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': _setting(environ, 'DB_POOL_SIZE'),
+        'max_overflow': _setting(environ, 'DB_MAX_OVERFLOW'),
+        'pool_timeout': _setting(environ, 'DB_POOL_TIMEOUT'),
+        'pool_recycle': _setting(environ, 'DB_POOL_RECYCLE'),
+        'pool_pre_ping': bool(_setting(environ, 'DB_POOL_PRE_PING')),
+    }
+    statement_timeout = _setting(environ, 'DB_STATEMENT_TIMEOUT')
+    if statement_timeout and url.get_backend_name() in ('postgresql', 'postgres'):
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(statement_timeout)}
+    return options
+
+
+'''
+pool_metrics(engine)
+    a snapshot of engine's pool: connections checked out and idle, overflow
+    in use and, for an InstrumentedQueuePool, checkout wait times
+'''
+def pool_metrics(engine):
+    pool = engine.pool
+    metrics = {
+        'pid': os.getpid(),
+        'pool': type(pool).__name__,
+    }
+    if isinstance(pool, QueuePool):
+        metrics.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+        })
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            metrics.update({
+                'checkouts': pool.checkouts,
+                'timeouts': pool.timeouts,
+                'wait_ms_total': round(pool.wait_total * 1000, 3),
+                'wait_ms_avg': round(pool.wait_total * 1000 / pool.checkouts, 3) if pool.checkouts else 0.0,
+                'wait_ms_max': round(pool.wait_max * 1000, 3),
+            })
+    return metrics
+
+
+'''
+configure_database(app, db, database_uri, environ)
+    points app at database_uri with pool options from engine_options(), and
+    with DB_POOL_METRICS=1 serves the process's pool_metrics() as JSON at
+    /_db/pool. Call it before the app first uses the database.
+'''
+def configure_database(app, db, database_uri, environ=os.environ):
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_uri, environ)
+    if _setting(environ, 'DB_POOL_METRICS') and 'db_pool_metrics' not in app.view_functions:
+        app.add_url_rule('/_db/pool', 'db_pool_metrics', lambda: jsonify(pool_metrics(db.engine)))
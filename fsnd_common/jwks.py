@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from urllib.request import urlopen
+
+logger = logging.getLogger(__name__)
+
+# used when the JWKS response carries no Cache-Control max-age
+DEFAULT_TTL = 600
+# floor for how often an unknown kid may trigger a fetch, and how long to
+# wait before retrying after a failed fetch
+MIN_REFETCH_INTERVAL = 30
+# the background thread refreshes once this fraction of the ttl has passed
+REFRESH_AT = 0.8
+JWK_FIELDS = ('kty', 'kid', 'use', 'n', 'e')
+
+'''
+parse_max_age(cache_control)
+    the max-age of a Cache-Control header in seconds, 0 for no-cache or
+    no-store, None when the header does not say
+'''
+def parse_max_age(cache_control):
+    if not cache_control:
+        return None
+    directives = cache_control.lower()
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0
+    match = re.search(r'max-age\s*=\s*"?(\d+)', directives)
+    return int(match.group(1)) if match else None
+
+'''
+url_source(url, timeout)
+    a JWKS source that fetches url (https:// or file://) and honours the
+    response's Cache-Control max-age
+'''
+def url_source(url, timeout=5):
+    def fetch():
+        with urlopen(url, timeout=timeout) as response:
+            jwks = json.loads(response.read())
+            return jwks, parse_max_age(response.headers.get('Cache-Control'))
+    return fetch
+
+'''
+file_source(path)
+    a JWKS source that reads a local key set, for tests and offline use
+'''
+def file_source(path):
+    def fetch():
+        with open(path) as f:
+            return json.load(f), None
+    return fetch
+
+'''
+JWKSStore
+    the signing keys of the identity provider, indexed by kid.
+
+    A source is any callable returning (jwks dict, max-age or None). Keys are
+    kept for the max-age the source reports (DEFAULT_TTL otherwise) and a
+    daemon thread refreshes them before they expire, so requests never wait
+    on the network for a known kid. An unknown kid triggers one on-demand
+    fetch, at most every min_refetch_interval seconds. When a fetch fails the
+    previous keys keep being served.
+
+    version counts the changes to the key set, so caches of tokens verified
+    against it can tell when a key was rotated in or revoked.
+'''
+class JWKSStore:
+    def __init__(self, source, ttl=DEFAULT_TTL, min_refetch_interval=MIN_REFETCH_INTERVAL, background=True):
+        self.source = source
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.background = background
+        self.version = 0
+        self._keys = {}
+        self._expires = 0
+        self._refresh_at = 0
+        self._last_fetch = None
+        self._fetch_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._pending = None
+
+    '''
+    get(kid)
+        the JWK for kid, or None when the provider does not publish it
+    '''
+    def get(self, kid):
+        self._ensure_refresher()
+        key = self._keys.get(kid)
+        if key is not None:
+            # an expired key is served on only while the fetch fails or is
+            # rate limited; once the provider answers, a revoked kid is gone
+            if not self.background and time.monotonic() >= self._expires and \
+                    self.refresh(rate_limited=True):
+                return self._keys.get(kid)
+            return key
+        self.refresh(rate_limited=True)
+        return self._keys.get(kid)
+
+    '''
+    load(kid)
+        coroutine for asyncio servers that returns once get(kid) can answer
+        without touching the network. The fetch an unknown kid triggers runs
+        in the event loop's default executor and is shared by every request
+        waiting on it, so the loop keeps serving while it is in flight.
+    '''
+    async def load(self, kid):
+        self._ensure_refresher()
+        if kid in self._keys and (self.background or time.monotonic() < self._expires):
+            return
+        if self._pending is None:
+            self._pending = asyncio.get_event_loop().run_in_executor(None, self.refresh, True)
+            self._pending.add_done_callback(self._fetched)
+        await asyncio.shield(self._pending)
+
+    def _fetched(self, future):
+        self._pending = None
+
+    '''
+    refresh(rate_limited, scheduled)
+        fetches the key set now. Returns True when the keys were replaced.
+        A scheduled refresh is skipped when another fetch already moved the
+        next refresh time forward.
+    '''
+    def refresh(self, rate_limited=False, scheduled=False):
+        with self._fetch_lock:
+            now = time.monotonic()
+            if rate_limited and self._last_fetch is not None and \
+                    now - self._last_fetch < self.min_refetch_interval:
+                return False
+            if scheduled and now < self._refresh_at:
+                return False
+            self._last_fetch = now
+            try:
+                jwks, max_age = self.source()
+                keys = {
+                    key['kid']: {field: key.get(field) for field in JWK_FIELDS}
+                    for key in jwks['keys'] if 'kid' in key
+                }
+            except Exception:
+                logger.warning('JWKS fetch failed, serving %d cached keys', len(self._keys), exc_info=True)
+                self._refresh_at = now + self.min_refetch_interval
+                return False
+            lifetime = self.ttl if max_age is None else max_age
+            if keys != self._keys:
+                self.version += 1
+            self._keys = keys
+            self._expires = now + lifetime
+            self._refresh_at = now + max(lifetime * REFRESH_AT, self.min_refetch_interval)
+            return True
+
+    '''
+    set_source(source)
+        swaps the JWKS source, e.g. for a local file or stub server in
+        tests, and drops the keys fetched from the previous one
+    '''
+    def set_source(self, source):
+        with self._fetch_lock:
+            self.source = source
+            self.version += 1
+            self._keys = {}
+            self._expires = 0
+            self._refresh_at = 0
+            self._last_fetch = None
+        self._wakeup.set()
+
+    def _ensure_refresher(self):
+        if not self.background:
+            return
+        # threads do not survive a fork, so a pre-forking server gets one per worker
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._fetch_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='jwks-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            delay = self._refresh_at - time.monotonic()
+            if delay > 0:
+                self._wakeup.wait(delay)
+                self._wakeup.clear()
+                continue
+            self.refresh(scheduled=True)
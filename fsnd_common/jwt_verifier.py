@@ -0,0 +1,192 @@
+import base64
+import binascii
+import json
+import threading
+import time
+
+from flask import request
+from jose import jwk
+
+'''
+AuthError Exception
+A standardized way to communicate auth failure modes
+'''
+class AuthError(Exception):
+    def __init__(self, error, status_code):
+        self.error = error
+        self.status_code = status_code
+
+
+'''
+get_token_auth_header(headers)
+    the bearer token from the Authorization header in headers, by default
+    the current flask request's, raises AuthError when the header is
+    missing or malformed
+'''
+def get_token_auth_header(headers=None):
+    if headers is None:
+        headers = request.headers
+    auth = headers.get('Authorization', None)
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+
+    parts = auth.split()
+    if not parts or parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    return parts[1]
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + b'=' * (-len(segment) % 4))
+
+
+def _malformed():
+    return AuthError({
+        'code': 'invalid_header',
+        'description': 'Authorization malformed.'
+    }, 401)
+
+
+def _unparseable():
+    return AuthError({
+        'code': 'invalid_header',
+        'description': 'Unable to parse authentication token.'
+    }, 400)
+
+
+def _invalid_claims(description):
+    return AuthError({
+        'code': 'invalid_claims',
+        'description': description
+    }, 401)
+
+
+'''
+JWTVerifier
+    verifies RS256 access tokens against the signing keys in a JWKSStore
+    (see fsnd_common.jwks) and returns their payload.
+
+    The public key object for each kid is constructed once, the first time
+    a token signed with it arrives, and found again with a dict lookup;
+    it is rebuilt only when the store publishes a different key under that
+    kid. leeway is the clock skew in seconds tolerated on exp and nbf.
+'''
+class JWTVerifier:
+    def __init__(self, keys, audience, issuer, algorithms=('RS256',), leeway=0):
+        self.keys = keys
+        self.audience = audience
+        self.issuer = issuer
+        self.algorithms = tuple(algorithms)
+        self.leeway = leeway
+        self._lock = threading.Lock()
+        self._constructed = {}
+
+    def _key(self, kid, alg):
+        published = self.keys.get(kid)
+        if published is None:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Unable to find the appropriate key.'
+            }, 400)
+        entry = self._constructed.get((kid, alg))
+        if entry is None or entry[0] is not published:
+            try:
+                key = jwk.construct(published, alg)
+            except Exception:
+                raise _unparseable()
+            entry = (published, key)
+            with self._lock:
+                self._constructed[(kid, alg)] = entry
+        return entry[1]
+
+    def _validate_claims(self, payload):
+        now = time.time()
+        exp = payload.get('exp')
+        if exp is not None:
+            if not isinstance(exp, (int, float)):
+                raise _invalid_claims('Expiration Time claim (exp) must be a number.')
+            if now > exp + self.leeway:
+                raise AuthError({
+                    'code': 'token_expired',
+                    'description': 'Token expired.'
+                }, 401)
+        nbf = payload.get('nbf')
+        if nbf is not None:
+            if not isinstance(nbf, (int, float)):
+                raise _invalid_claims('Not Before claim (nbf) must be a number.')
+            if now < nbf - self.leeway:
+                raise _invalid_claims('The token is not yet valid (nbf).')
+        if self.audience is not None:
+            aud = payload.get('aud')
+            audiences = aud if isinstance(aud, list) else [aud]
+            if self.audience not in audiences:
+                raise _invalid_claims('Incorrect claims. Please, check the audience and issuer.')
+        if self.issuer is not None and payload.get('iss') != self.issuer:
+            raise _invalid_claims('Incorrect claims. Please, check the audience and issuer.')
+
+    def _parse(self, token):
+        # (header, signing input, payload segment, signature segment)
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        try:
+            signing_input, signature = token.rsplit(b'.', 1)
+            header_segment, payload_segment = signing_input.split(b'.', 1)
+            header = json.loads(_b64decode(header_segment))
+        except (ValueError, TypeError, binascii.Error):
+            raise _malformed()
+        if not isinstance(header, dict) or not isinstance(header.get('kid'), str):
+            raise _malformed()
+        if header.get('alg') not in self.algorithms:
+            raise _unparseable()
+        return header, signing_input, payload_segment, signature
+
+    def _check(self, header, signing_input, payload_segment, signature):
+        key = self._key(header['kid'], header['alg'])
+        try:
+            if not key.verify(signing_input, _b64decode(signature)):
+                raise _unparseable()
+            payload = json.loads(_b64decode(payload_segment))
+        except Exception:
+            raise _unparseable()
+        if not isinstance(payload, dict):
+            raise _unparseable()
+
+        self._validate_claims(payload)
+        return payload
+
+    '''
+    verify(token)
+        the payload of token once its signature and claims check out,
+        raises AuthError otherwise
+    '''
+    def verify(self, token):
+        return self._check(*self._parse(token))
+
+    '''
+    verify_async(token)
+        verify() for asyncio servers. Awaits keys.load(kid) first, so a
+        token signed with a key not fetched yet never blocks the event loop.
+    '''
+    async def verify_async(self, token):
+        parsed = self._parse(token)
+        await self.keys.load(parsed[0]['kid'])
+        return self._check(*parsed)
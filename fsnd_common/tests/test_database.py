@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError
+
+from fsnd_common.database import InstrumentedQueuePool, configure_database, engine_options, pool_metrics
+
+POSTGRES = 'postgresql://localhost:5432/fsnd'
+
+
+class EngineOptionsTestCase(unittest.TestCase):
+    """engine_options() and configure_database() against a fake environment"""
+
+    # test_defaults
+    def test_defaults(self):
+        options = engine_options(POSTGRES, {})
+
+        self.assertIs(options['poolclass'], InstrumentedQueuePool)
+        self.assertEqual(options['pool_size'], 5)
+        self.assertEqual(options['max_overflow'], 10)
+        self.assertEqual(options['pool_timeout'], 30)
+        self.assertEqual(options['pool_recycle'], 1800)
+        self.assertIs(options['pool_pre_ping'], True)
+        self.assertNotIn('connect_args', options)
+
+    # test_environment
+    def test_environment(self):
+        options = engine_options(POSTGRES, {'DB_POOL_SIZE': '2', 'DB_MAX_OVERFLOW': '0',
+                                            'DB_POOL_PRE_PING': '0', 'DB_STATEMENT_TIMEOUT': '5000',
+                                            'DB_POOL_TIMEOUT': ''})
+
+        self.assertEqual(options['pool_size'], 2)
+        self.assertEqual(options['max_overflow'], 0)
+        self.assertEqual(options['pool_timeout'], 30)
+        self.assertIs(options['pool_pre_ping'], False)
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=5000'})
+
+    # test_bad_setting
+    def test_bad_setting(self):
+        with self.assertRaises(ValueError) as raised:
+            engine_options(POSTGRES, {'DB_POOL_SIZE': 'five'})
+        self.assertIn('DB_POOL_SIZE', str(raised.exception))
+
+    # test_sqlite
+    def test_sqlite(self):
+        self.assertEqual(engine_options('sqlite:///fsnd.db', {'DB_POOL_SIZE': '2'}), {})
+
+    # test_configure_database
+    def test_configure_database(self):
+        app = Flask(__name__)
+        configure_database(app, SQLAlchemy(), POSTGRES, {'DB_POOL_SIZE': '3'})
+
+        self.assertEqual(app.config['SQLALCHEMY_DATABASE_URI'], POSTGRES)
+        self.assertIs(app.config['SQLALCHEMY_TRACK_MODIFICATIONS'], False)
+        self.assertEqual(app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'], 3)
+        self.assertNotIn('db_pool_metrics', app.view_functions)
+
+    # test_pool_metrics_route
+    def test_pool_metrics_route(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = Flask(__name__)
+            db = SQLAlchemy()
+            configure_database(app, db, 'sqlite:///' + os.path.join(tmp, 'fsnd.db'), {'DB_POOL_METRICS': '1'})
+            db.init_app(app)
+            res = app.test_client().get('/_db/pool')
+            data = json.loads(res.data)
+            with app.app_context():
+                db.engine.dispose()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['pid'], os.getpid())
+
+
+class InstrumentedQueuePoolTestCase(unittest.TestCase):
+    """checkout statistics of an InstrumentedQueuePool over a sqlite file"""
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.engine = create_engine('sqlite:///' + os.path.join(self.tempdir.name, 'pool.db'),
+                                    poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0,
+                                    pool_timeout=0.2)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tempdir.cleanup()
+
+    # test_checkouts
+    def test_checkouts(self):
+        for _ in range(3):
+            with self.engine.connect() as conn:
+                conn.execute('SELECT 1')
+        metrics = pool_metrics(self.engine)
+
+        self.assertEqual(metrics['pool'], 'InstrumentedQueuePool')
+        self.assertEqual(metrics['checkouts'], 3)
+        self.assertEqual(metrics['timeouts'], 0)
+        self.assertEqual(metrics['checked_out'], 0)
+        self.assertEqual(metrics['checked_in'], 1)
+        self.assertGreaterEqual(metrics['wait_ms_max'], metrics['wait_ms_avg'])
+
+    # test_timeout
+    def test_timeout(self):
+        held = self.engine.connect()
+        try:
+            with self.assertRaises(TimeoutError):
+                self.engine.connect()
+            metrics = pool_metrics(self.engine)
+        finally:
+            held.close()
+
+        self.assertEqual(metrics['checked_out'], 1)
+        self.assertEqual(metrics['timeouts'], 1)
+        self.assertEqual(metrics['checkouts'], 2)
+        self.assertGreaterEqual(metrics['wait_ms_max'], 200)
+
+    # test_waits_for_a_connection
+    def test_waits_for_a_connection(self):
+        held = self.engine.connect()
+        release = threading.Timer(0.05, held.close)
+        release.start()
+        with self.engine.connect() as conn:
+            conn.execute('SELECT 1')
+        release.join()
+        metrics = pool_metrics(self.engine)
+
+        self.assertEqual(metrics['timeouts'], 0)
+        self.assertGreaterEqual(metrics['wait_ms_max'], 40)
+
+    # test_recreate_keeps_counting
+    def test_recreate_keeps_counting(self):
+        with self.engine.connect() as conn:
+            conn.execute('SELECT 1')
+        self.engine.dispose()
+        with self.engine.connect() as conn:
+            conn.execute('SELECT 1')
+
+        self.assertIsInstance(self.engine.pool, InstrumentedQueuePool)
+        self.assertEqual(pool_metrics(self.engine)['checkouts'], 2)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,198 @@
+import threading
+import time
+import unittest
+
+from jose import jwt
+
+from fsnd_common.bench_jwt_verifier import _b64, generate_keypair
+from fsnd_common.jwks import JWKSStore, parse_max_age
+from fsnd_common.jwt_verifier import AuthError, JWTVerifier
+
+OLD = generate_keypair()
+NEW = generate_keypair()
+
+
+def jwk(kid, keypair):
+    _, n, e = keypair
+    return {'kty': 'RSA', 'kid': kid, 'use': 'sig', 'n': _b64(n), 'e': _b64(e)}
+
+
+class Source:
+    """a JWKS source serving whatever key set a test puts in keys, and
+    counting its fetches"""
+
+    def __init__(self, *keys, max_age=None):
+        self.keys = list(keys)
+        self.max_age = max_age
+        self.fetches = 0
+        self.fetched = threading.Condition()
+
+    def __call__(self):
+        with self.fetched:
+            self.fetches += 1
+            self.fetched.notify_all()
+        return {'keys': list(self.keys)}, self.max_age
+
+    def wait_for(self, fetches, timeout=5):
+        with self.fetched:
+            return self.fetched.wait_for(lambda: self.fetches >= fetches, timeout)
+
+
+def token(kid, keypair):
+    return jwt.encode({'sub': 'user', 'exp': int(time.time()) + 3600}, keypair[0],
+                      algorithm='RS256', headers={'kid': kid})
+
+
+class JWKSStoreTestCase(unittest.TestCase):
+    """JWKSStore fetching, rotation and revocation against an in-memory source"""
+
+    def setUp(self):
+        self.source = Source(jwk('old', OLD))
+        self.store = JWKSStore(self.source, min_refetch_interval=0, background=False)
+        self.verifier = JWTVerifier(self.store, audience=None, issuer=None)
+
+    def assertRejected(self, token):
+        with self.assertRaises(AuthError) as raised:
+            self.verifier.verify(token)
+        self.assertEqual(raised.exception.status_code, 400)
+        self.assertEqual(raised.exception.error['code'], 'invalid_header')
+
+    # test_parse_max_age
+    def test_parse_max_age(self):
+        self.assertEqual(parse_max_age('public, max-age=86400'), 86400)
+        self.assertEqual(parse_max_age('max-age="60"'), 60)
+        self.assertEqual(parse_max_age('no-cache'), 0)
+        self.assertIsNone(parse_max_age('public'))
+        self.assertIsNone(parse_max_age(None))
+
+    # test_known_kid_fetched_once
+    def test_known_kid_fetched_once(self):
+        for _ in range(3):
+            self.assertEqual(self.verifier.verify(token('old', OLD))['sub'], 'user')
+
+        self.assertEqual(self.source.fetches, 1)
+
+    # test_rotated_key_picked_up
+    def test_rotated_key_picked_up(self):
+        self.verifier.verify(token('old', OLD))
+        version = self.store.version
+        self.source.keys.append(jwk('new', NEW))
+
+        self.assertEqual(self.verifier.verify(token('new', NEW))['sub'], 'user')
+        self.assertEqual(self.source.fetches, 2)
+        self.assertEqual(self.store.version, version + 1)
+        self.assertEqual(self.verifier.verify(token('old', OLD))['sub'], 'user')
+
+    # test_unknown_kid_rate_limited
+    def test_unknown_kid_rate_limited(self):
+        self.store.min_refetch_interval = 3600
+        self.verifier.verify(token('old', OLD))
+        self.source.keys.append(jwk('new', NEW))
+
+        self.assertRejected(token('new', NEW))
+        self.assertRejected(token('new', NEW))
+        self.assertEqual(self.source.fetches, 1)
+
+    # test_revoked_key_stops_working
+    def test_revoked_key_stops_working(self):
+        self.verifier.verify(token('old', OLD))
+        version = self.store.version
+        self.source.keys = [jwk('new', NEW)]
+
+        self.assertTrue(self.store.refresh())
+        self.assertEqual(self.store.version, version + 1)
+        self.assertRejected(token('old', OLD))
+        self.assertEqual(self.verifier.verify(token('new', NEW))['sub'], 'user')
+
+    # test_replaced_key_under_same_kid
+    def test_replaced_key_under_same_kid(self):
+        self.verifier.verify(token('old', OLD))
+        self.source.keys = [jwk('old', NEW)]
+        self.store.refresh()
+
+        self.assertRejected(token('old', OLD))
+        self.assertEqual(self.verifier.verify(token('old', NEW))['sub'], 'user')
+
+    # test_unchanged_refresh_keeps_version
+    def test_unchanged_refresh_keeps_version(self):
+        self.store.refresh()
+        version = self.store.version
+        self.store.refresh()
+
+        self.assertEqual(self.source.fetches, 2)
+        self.assertEqual(self.store.version, version)
+
+    # test_failed_fetch_keeps_keys
+    def test_failed_fetch_keeps_keys(self):
+        self.verifier.verify(token('old', OLD))
+        version = self.store.version
+
+        def unreachable():
+            raise OSError('connection refused')
+        self.store.source = unreachable
+        with self.assertLogs('fsnd_common.jwks', 'WARNING'):
+            self.assertFalse(self.store.refresh())
+
+        self.assertEqual(self.store.version, version)
+        self.assertEqual(self.verifier.verify(token('old', OLD))['sub'], 'user')
+
+    # test_expired_keys_refetched_without_background
+    def test_expired_keys_refetched_without_background(self):
+        self.source.max_age = 0
+        self.verifier.verify(token('old', OLD))
+        self.source.keys = [jwk('new', NEW)]
+
+        self.assertRejected(token('old', OLD))
+        self.assertEqual(self.source.fetches, 2)
+
+
+class BackgroundRefreshTestCase(unittest.TestCase):
+    """the refresh thread of a JWKSStore with background=True"""
+
+    def setUp(self):
+        # keys good for 0.2s, refreshed after 0.16s
+        self.source = Source(jwk('old', OLD), max_age=0.2)
+        self.store = JWKSStore(self.source, min_refetch_interval=0.05)
+
+    def tearDown(self):
+        # park the daemon thread: its next refresh is an hour away
+        self.source.max_age = 3600
+        self.store.refresh()
+
+    # test_refreshes_before_expiry
+    def test_refreshes_before_expiry(self):
+        self.assertIsNotNone(self.store.get('old'))
+        self.assertTrue(self.source.wait_for(3))
+
+    # test_rotation_without_a_request
+    def test_rotation_without_a_request(self):
+        self.store.get('old')
+        fetches = self.source.fetches
+        version = self.store.version
+        self.source.keys = [jwk('new', NEW)]
+        self.assertTrue(self.source.wait_for(fetches + 1))
+
+        # the thread replaced the keys on its own; nothing fetches on demand
+        fetches = self.source.fetches
+        self.assertIsNotNone(self.store.get('new'))
+        self.assertIsNone(self.store._keys.get('old'))
+        self.assertGreater(self.store.version, version)
+        self.assertLessEqual(self.source.fetches, fetches + 1)
+
+    # test_set_source_wakes_the_thread
+    def test_set_source_wakes_the_thread(self):
+        self.store.get('old')
+        self.source.max_age = 3600
+        self.store.refresh()
+        replacement = Source(jwk('new', NEW), max_age=3600)
+        self.store.set_source(replacement)
+
+        self.assertTrue(replacement.wait_for(1))
+        self.assertIsNotNone(self.store.get('new'))
+        self.assertEqual(replacement.fetches, 1)
+        self.source = replacement
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
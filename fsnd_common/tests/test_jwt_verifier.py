@@ -0,0 +1,148 @@
+import asyncio
+import base64
+import json
+import time
+import unittest
+
+from jose import jwt
+
+from fsnd_common.bench_jwt_verifier import _b64, generate_keypair
+from fsnd_common.jwks import JWKSStore
+from fsnd_common.jwt_verifier import AuthError, JWTVerifier
+
+ISSUER = 'https://test.example.com/'
+AUDIENCE = 'coffee'
+PEM, N, E = generate_keypair()
+
+
+def segment(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).rstrip(b'=').decode()
+
+
+class JWTVerifierTestCase(unittest.TestCase):
+    """JWTVerifier against a key set holding one locally generated key"""
+
+    def setUp(self):
+        jwks = {'keys': [{'kty': 'RSA', 'kid': 'test', 'use': 'sig', 'n': _b64(N), 'e': _b64(E)}]}
+        self.store = JWKSStore(lambda: (jwks, None), background=False)
+        self.verifier = JWTVerifier(self.store, AUDIENCE, ISSUER)
+
+    def claims(self, **overrides):
+        claims = {'sub': 'user', 'aud': AUDIENCE, 'iss': ISSUER, 'exp': int(time.time()) + 3600,
+                  'permissions': ['get:drinks-detail']}
+        claims.update(overrides)
+        return claims
+
+    def token(self, kid='test', **overrides):
+        return jwt.encode(self.claims(**overrides), PEM, algorithm='RS256', headers={'kid': kid})
+
+    def assertRejected(self, token, status_code, code):
+        with self.assertRaises(AuthError) as raised:
+            self.verifier.verify(token)
+        self.assertEqual(raised.exception.status_code, status_code)
+        self.assertEqual(raised.exception.error['code'], code)
+
+    # test_verify
+    def test_verify(self):
+        payload = self.verifier.verify(self.token())
+
+        self.assertEqual(payload['sub'], 'user')
+        self.assertEqual(payload['permissions'], ['get:drinks-detail'])
+
+    # test_tampered_payload
+    def test_tampered_payload(self):
+        header, _, signature = self.token().split('.')
+        forged = segment(self.claims(permissions=['delete:drinks']))
+
+        self.assertRejected('.'.join((header, forged, signature)), 400, 'invalid_header')
+
+    # test_tampered_signature
+    def test_tampered_signature(self):
+        header, payload, signature = self.token().split('.')
+        signature = ('A' if signature[0] != 'A' else 'B') + signature[1:]
+
+        self.assertRejected('.'.join((header, payload, signature)), 400, 'invalid_header')
+
+    # test_alg_none
+    def test_alg_none(self):
+        token = '.'.join((segment({'alg': 'none', 'kid': 'test', 'typ': 'JWT'}), segment(self.claims()), ''))
+
+        self.assertRejected(token, 400, 'invalid_header')
+
+    # test_alg_hs256
+    def test_alg_hs256(self):
+        # signed with the public key as an HMAC secret, the classic confusion attack
+        secret = json.dumps(self.store.get('test'))
+        token = jwt.encode(self.claims(), secret, algorithm='HS256', headers={'kid': 'test'})
+
+        self.assertRejected(token, 400, 'invalid_header')
+
+    # test_malformed
+    def test_malformed(self):
+        self.assertRejected('not-a-token', 401, 'invalid_header')
+        self.assertRejected('a.b.c', 401, 'invalid_header')
+
+    # test_missing_kid
+    def test_missing_kid(self):
+        token = jwt.encode(self.claims(), PEM, algorithm='RS256')
+
+        self.assertRejected(token, 401, 'invalid_header')
+
+    # test_kid_not_a_string
+    def test_kid_not_a_string(self):
+        for kid in (['test'], {'kid': 'test'}, 7, None):
+            with self.subTest(kid=kid):
+                token = '.'.join((segment({'alg': 'RS256', 'kid': kid}), segment(self.claims()), 'c2ln'))
+                self.assertRejected(token, 401, 'invalid_header')
+
+    # test_unknown_kid
+    def test_unknown_kid(self):
+        self.assertRejected(self.token(kid='rotated-away'), 400, 'invalid_header')
+
+    # test_expired
+    def test_expired(self):
+        self.assertRejected(self.token(exp=int(time.time()) - 10), 401, 'token_expired')
+
+    # test_expired_within_leeway
+    def test_expired_within_leeway(self):
+        self.verifier.leeway = 60
+        payload = self.verifier.verify(self.token(exp=int(time.time()) - 10))
+
+        self.assertEqual(payload['sub'], 'user')
+        self.verifier.leeway = 5
+        self.assertRejected(self.token(exp=int(time.time()) - 10), 401, 'token_expired')
+
+    # test_not_before
+    def test_not_before(self):
+        self.assertRejected(self.token(nbf=int(time.time()) + 600), 401, 'invalid_claims')
+
+    # test_exp_not_a_number
+    def test_exp_not_a_number(self):
+        self.assertRejected(self.token(exp='tomorrow'), 401, 'invalid_claims')
+
+    # test_wrong_audience
+    def test_wrong_audience(self):
+        self.assertRejected(self.token(aud='someone-else'), 401, 'invalid_claims')
+
+    # test_audience_list
+    def test_audience_list(self):
+        payload = self.verifier.verify(self.token(aud=['someone-else', AUDIENCE]))
+
+        self.assertEqual(payload['sub'], 'user')
+
+    # test_wrong_issuer
+    def test_wrong_issuer(self):
+        self.assertRejected(self.token(iss='https://evil.example.com/'), 401, 'invalid_claims')
+
+    # test_verify_async
+    def test_verify_async(self):
+        payload = asyncio.run(self.verifier.verify_async(self.token()))
+
+        self.assertEqual(payload['sub'], 'user')
+        with self.assertRaises(AuthError):
+            asyncio.run(self.verifier.verify_async(self.token(kid='rotated-away')))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
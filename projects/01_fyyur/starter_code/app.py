@@ -2,16 +2,23 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import os
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import base64
+import binascii
+import click
+from datetime import datetime
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
+from flask_migrate import Migrate
 from forms import *
+from filters import format_datetime
+from search import create_trigram_indexes, search_names, prefix_names
+
+from fsnd_common.database import configure_database
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -20,6 +27,7 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
 db = SQLAlchemy(app)
+configure_database(app, db, app.config['SQLALCHEMY_DATABASE_URI'])
 
 # TODO: connect to a local postgresql database
 migrate = Migrate(app,db)
@@ -27,6 +35,28 @@ migrate = Migrate(app,db)
 # Models.
 #----------------------------------------------------------------------------#
 
+# genres are rows of their own, linked to venues and artists through
+# association tables. Each table's primary key leads with the owner; the
+# genre_id index serves the reverse lookup behind /genres/<name>.
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id', 'genre_id', 'venue_id'))
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id', 'genre_id', 'artist_id'))
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    def __repr__(self):
+      return f'<Genre {self.id} name: {self.name}>'
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
 
@@ -44,6 +74,10 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean, default=True)
     seeking_description = db.Column(db.String(250))
     shows = db.relationship('Show', backref='venue', lazy=True)
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name', lazy=True)
+    # maintained by count_show() and roll_show_counters(), see below
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
       return f'<Venue {self.id} name: {self.name}>'
@@ -56,15 +90,102 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
     shows = db.relationship('Show', backref='artist', lazy=True)
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name', lazy=True)
+    # maintained by count_show() and roll_show_counters(), see below
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
       return f'<Artist {self.id} name: {self.name}>'
+
+# lower(name) indexes behind the case-insensitive name search and typeahead
+db.Index('ix_venue_name_lower', db.func.lower(Venue.name))
+db.Index('ix_artist_name_lower', db.func.lower(Artist.name))
+
+# upcoming_shows_count / past_shows_count on venues and artists split their
+# shows at the watermark rather than at the current time: a show is
+# upcoming while its start_time is after ShowCounterWatermark.rolled_at.
+# Inserting a show bumps one counter on each side; roll_show_counters(),
+# run periodically, moves the shows that started since the last run from
+# upcoming to past and advances the watermark.
+
+COUNTER_EPOCH = datetime(1970, 1, 1)
+
+def counter_watermark(lock=False, shared=False):
+  query = ShowCounterWatermark.query.filter_by(id=1)
+  if lock:
+    query = query.with_for_update(read=shared)
+  mark = query.first()
+  if mark is None:
+    mark = ShowCounterWatermark(id=1, rolled_at=COUNTER_EPOCH)
+    db.session.add(mark)
+    db.session.flush()
+  return mark
+
+def count_show(show, rolled_at):
+  # one atomic UPDATE ... SET n = n + 1 per side, in the caller's transaction
+  column = 'upcoming_shows_count' if show.start_time > rolled_at else 'past_shows_count'
+  for model, owner_id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+    counter = getattr(model, column)
+    model.query.filter(model.id == owner_id).update({counter: counter + 1}, synchronize_session=False)
+
+def roll_show_counters(now=None):
+  # returns the number of shows moved from upcoming to past
+  now = now or datetime.now()
+  mark = counter_watermark(lock=True)
+  if now <= mark.rolled_at:
+    db.session.rollback()
+    return 0
+  moved = 0
+  for model, owner in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+    rows = db.session.query(owner, db.func.count(Show.id)) \
+      .filter(Show.start_time > mark.rolled_at, Show.start_time <= now) \
+      .group_by(owner).all()
+    if rows:
+      table = model.__table__
+      db.session.execute(
+        table.update().where(table.c.id == db.bindparam('owner_id')).values(
+          upcoming_shows_count=table.c.upcoming_shows_count - db.bindparam('moved'),
+          past_shows_count=table.c.past_shows_count + db.bindparam('moved')),
+        [{'owner_id': owner_id, 'moved': n} for owner_id, n in rows])
+    moved = sum(n for _, n in rows)
+  mark.rolled_at = now
+  db.session.commit()
+  return moved
+
+def rebuild_show_counters(now=None):
+  # recounts every venue and artist from the Show table, e.g. after a bulk
+  # load or when the counters are first introduced
+  now = now or datetime.now()
+  mark = counter_watermark(lock=True)
+  for model, owner in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+    def count(condition):
+      return db.select([db.func.count(Show.id)]).where(owner == model.id).where(condition).as_scalar()
+    model.query.update({
+      model.upcoming_shows_count: count(Show.start_time > now),
+      model.past_shows_count: count(Show.start_time <= now)
+    }, synchronize_session=False)
+  mark.rolled_at = now
+  db.session.commit()
+
+def genres_named(names):
+  # the Genre rows for a list of names, creating the ones not seen before
+  names = sorted(set(name.strip() for name in names if name and name.strip()))
+  if not names:
+    return []
+  genres = Genre.query.filter(Genre.name.in_(names)).all()
+  known = {genre.name for genre in genres}
+  for name in names:
+    if name not in known:
+      genre = Genre(name=name)
+      db.session.add(genre)
+      genres.append(genre)
+  return genres
       
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
@@ -78,18 +199,28 @@ class Show(db.Model):
 
     def __repr__(self):
       return f'<Show {self.id}, Artist {self.artist_id}, Venue {self.venue_id}>'
+
+class ShowCounterWatermark(db.Model):
+    __tablename__ = 'ShowCounterWatermark'
+
+    # a single row: the time the show counters were last rolled forward to
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+      return f'<ShowCounterWatermark {self.rolled_at}>'
+
+# composite indexes behind the per-venue and per-artist show lists (owner,
+# then time), the /shows keyset pager (start_time, id) and the /venues
+# listing, which is read in (state, city, name) order
+db.Index('ix_show_venue_id_start_time', Show.venue_id, Show.start_time)
+db.Index('ix_show_artist_id_start_time', Show.artist_id, Show.start_time)
+db.Index('ix_show_start_time_id', Show.start_time, Show.id)
+db.Index('ix_venue_state_city_name', Venue.state, Venue.city, Venue.name)
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
-
 app.jinja_env.filters['datetime'] = format_datetime
 
 #----------------------------------------------------------------------------#
@@ -106,73 +237,75 @@ def index():
 
 @app.route('/venues')
 def venues():
-  data = []
-  
-  venues = Venue.query.all()
-  locations = set()
-
-  for venue in venues:
-    locations.add((venue.city, venue.state))
-
-  for location in locations:
-    data.append({
-        "city": location[0],
-        "state": location[1],
+  # venues with their upcoming show counters, ordered by area so the
+  # grouping below is a single pass
+  rows = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_shows_count) \
+    .order_by(Venue.state, Venue.city, Venue.name) \
+    .all()
+
+  areas = {}
+  for venue_id, name, city, state, upcoming in rows:
+    area = areas.get((city, state))
+    if area is None:
+      area = areas[(city, state)] = {
+        "city": city,
+        "state": state,
         "venues": []
+      }
+    area['venues'].append({
+        "id": venue_id,
+        "name": name,
+        "num_upcoming_shows": upcoming
     })
-  for venue in venues:
-    num_upcoming_shows = 0
-    shows = Show.query.filter_by(venue_id=venue.id).all()
-    current_date = datetime.now()
-    for show in shows:
-      if show.start_time > current_date:
-          num_upcoming_shows += 1
-    for venue_location in data:
-      if venue.state == venue_location['state'] and venue.city == venue_location['city']:
-        venue_location['venues'].append({
-            "id": venue.id,
-            "name": venue.name,
-            "num_upcoming_shows": num_upcoming_shows
-        })
-  return render_template('pages/venues.html', areas=data)
+  return render_template('pages/venues.html', areas=list(areas.values()))
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
   search_term = request.form.get('search_term', '')
-  result = Venue.query.filter(Venue.name.ilike(f'%{search_term}%'))
-
-  response={
-    "count": result.count(),
-    "data": result
-  }
+  response = search_names(db, Venue, search_term)
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 
+@app.route('/search/typeahead')
+def typeahead():
+  # autocomplete for the search boxes: up to a handful of venues and artists
+  # whose names start with ?q=, served from the lower(name) indexes
+  term = request.args.get('q', '').strip()
+  return jsonify({
+    "venues": prefix_names(db, Venue, term),
+    "artists": prefix_names(db, Artist, term)
+  })
+
+def split_shows(owner_column, owner_id, other):
+  # upcoming and past shows of one venue or artist, each fetched by its own
+  # filtered query with the other side of the show joined in, so the page
+  # costs the same few round trips however many shows there are
+  now = datetime.now()
+  shows = Show.query.options(db.joinedload(other)).filter(owner_column == owner_id)
+  upcoming = shows.filter(Show.start_time > now).order_by(Show.start_time).all()
+  past = shows.filter(Show.start_time <= now).order_by(db.desc(Show.start_time)).all()
+  return upcoming, past
+
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  venue = Venue.query.get(venue_id)
-  shows = Show.query.filter_by(venue_id=venue_id).all()
-  past_shows = []
-  upcoming_shows = []
-  current_time = datetime.now()
+  venue = Venue.query.get_or_404(venue_id)
+  upcoming, past = split_shows(Show.venue_id, venue_id, Show.artist)
 
-  for show in shows:
-    data = {
+  def show_data(show):
+    return {
           "artist_id": show.artist_id,
           "artist_name": show.artist.name,
-           "artist_image_link": show.artist.image_link,
-           "start_time": format_datetime(str(show.start_time))
+          "artist_image_link": show.artist.image_link,
+          "start_time": show.start_time
         }
-    if show.start_time > current_time:
-      upcoming_shows.append(data)
-    else:
-      past_shows.append(data)
+  upcoming_shows = [show_data(show) for show in upcoming]
+  past_shows = [show_data(show) for show in past]
 
   data={
     "id": venue.id,
     "name": venue.name,
-    "genres": venue.genres,
+    "genres": [genre.name for genre in venue.genres],
     "address": venue.address,
     "city": venue.city,
     "state": venue.state,
@@ -205,7 +338,7 @@ def create_venue_submission():
   try:
     form = VenueForm()
     venue = Venue(name=form.name.data, city=form.city.data, state=form.state.data, address=form.address.data,
-                  phone=form.phone.data, image_link=form.image_link.data,genres=form.genres.data, 
+                  phone=form.phone.data, image_link=form.image_link.data,genres=genres_named(form.genres.data), 
                   facebook_link=form.facebook_link.data, seeking_description=form.seeking_description.data,
                   website=form.website.data, seeking_talent=form.seeking_talent.data)
     db.session.add(venue)
@@ -266,40 +399,30 @@ def search_artists():
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
   search_term = request.form.get('search_term', '')
-  result = Artist.query.filter(Artist.name.ilike(f'%{search_term}%'))
-  response={
-    "count": result.count(),
-    "data": result
-  }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  response = search_names(db, Artist, search_term)
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
-  artist = Artist.query.get(artist_id)
-  shows = Show.query.filter_by(artist_id=artist_id).all()
-  past_shows = []
-  upcoming_shows = []
-  current_time = datetime.now()
-
-  # Filter shows by upcoming and past
-  for show in shows:
-    data = {
+  artist = Artist.query.get_or_404(artist_id)
+  upcoming, past = split_shows(Show.artist_id, artist_id, Show.venue)
+
+  def show_data(show):
+    return {
           "venue_id": show.venue_id,
           "venue_name": show.venue.name,
           "venue_image_link": show.venue.image_link,
-          "start_time": format_datetime(str(show.start_time))
+          "start_time": show.start_time
         }
-    if show.start_time > current_time:
-      upcoming_shows.append(data)
-    else:
-      past_shows.append(data)
+  upcoming_shows = [show_data(show) for show in upcoming]
+  past_shows = [show_data(show) for show in past]
 
   data={
     "id": artist.id,
     "name": artist.name,
-    "genres": artist.genres,
+    "genres": [genre.name for genre in artist.genres],
     "city": artist.city,
     "state": artist.state,
     "phone": artist.phone,
@@ -322,7 +445,7 @@ def edit_artist(artist_id):
   artist_data = {
         "id": artist.id,
         "name": artist.name,
-        "genres": artist.genres,
+        "genres": [genre.name for genre in artist.genres],
         "city": artist.city,
         "state": artist.state,
         "phone": artist.phone,
@@ -347,7 +470,7 @@ def edit_artist_submission(artist_id):
     artist.phone = form.phone.data
     artist.state = form.state.data
     artist.city = form.city.data
-    artist.genres = form.genres.data
+    artist.genres = genres_named(form.genres.data)
     artist.image_link = form.image_link.data
     artist.facebook_link = form.facebook_link.data
     
@@ -367,7 +490,7 @@ def edit_venue(venue_id):
   venue={
     "id": venue.id,
     "name": venue.name,
-    "genres": venue.genres,
+    "genres": [genre.name for genre in venue.genres],
     "address": venue.address,
     "city": venue.city,
     "state": venue.state,
@@ -391,7 +514,7 @@ def edit_venue_submission(venue_id):
     name = form.name.data
 
     venue.name = name
-    venue.genres = form.genres.data
+    venue.genres = genres_named(form.genres.data)
     venue.city = form.city.data
     venue.state = form.state.data
     venue.address = form.address.data
@@ -429,7 +552,7 @@ def create_artist_submission():
     form = ArtistForm()
 
     artist = Artist(name=form.name.data, city=form.city.data, state=form.city.data,
-                    phone=form.phone.data, genres=form.genres.data, 
+                    phone=form.phone.data, genres=genres_named(form.genres.data), 
                     image_link=form.image_link.data, facebook_link=form.facebook_link.data)
     
     db.session.add(artist)
@@ -447,28 +570,84 @@ def create_artist_submission():
   return render_template('pages/home.html')
 
 
+#  Genres
+#  ----------------------------------------------------------------
+
+@app.route('/genres/<name>')
+def show_genre(name):
+  # venues and artists tagged with a genre, read through the genre_id
+  # indexes on the association tables rather than scanning every listing
+  genre = Genre.query.filter_by(name=name).first_or_404()
+  venues = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state) \
+    .join(venue_genres, venue_genres.c.venue_id == Venue.id) \
+    .filter(venue_genres.c.genre_id == genre.id) \
+    .order_by(Venue.name).all()
+  artists = db.session.query(Artist.id, Artist.name, Artist.city, Artist.state) \
+    .join(artist_genres, artist_genres.c.artist_id == Artist.id) \
+    .filter(artist_genres.c.genre_id == genre.id) \
+    .order_by(Artist.name).all()
+
+  data = {
+    "name": genre.name,
+    "venues": [{"id": id, "name": name, "city": city, "state": state} for id, name, city, state in venues],
+    "artists": [{"id": id, "name": name, "city": city, "state": state} for id, name, city, state in artists]
+  }
+  return render_template('pages/show_genre.html', genre=data)
+
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
-def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  shows = Show.query.order_by(db.desc(Show.start_time))
+SHOWS_PER_PAGE = 30
 
-  data = []
+def encode_show_cursor(start_time, show_id):
+  # opaque ?before= token: the (start_time, id) of the last show on a page
+  raw = '{}|{}'.format(start_time.isoformat(), show_id)
+  return base64.urlsafe_b64encode(raw.encode()).decode()
 
-  for show in shows:
-    data.append({
-        "venue_id": show.venue_id,
-        "venue_name": show.venue.name,
-        "artist_id": show.artist_id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": format_datetime(str(show.start_time))
-    })
-  return render_template('pages/shows.html', shows=data)
+def decode_show_cursor(cursor):
+  try:
+    start_time, show_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(start_time), int(show_id)
+  except (binascii.Error, UnicodeDecodeError, ValueError):
+    abort(400)
+
+def stream_template(template_name, **context):
+  # renders a template in chunks as the response body is sent
+  app.update_template_context(context)
+  stream = app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(5)
+  return stream
+
+@app.route('/shows')
+def shows():
+  # displays list of shows at /shows, newest first, one page at a time.
+  # ?before=<cursor> seeks past the last show of the previous page on
+  # (start_time, id), so deep pages cost the same as the first one.
+  query = db.session.query(Show.id, Show.start_time, Show.venue_id, Venue.name,
+                           Show.artist_id, Artist.name, Artist.image_link) \
+    .join(Venue, Show.venue_id == Venue.id) \
+    .join(Artist, Show.artist_id == Artist.id)
+  cursor = request.args.get('before')
+  if cursor:
+    start_time, show_id = decode_show_cursor(cursor)
+    query = query.filter(db.or_(Show.start_time < start_time,
+                                db.and_(Show.start_time == start_time, Show.id < show_id)))
+  rows = query.order_by(db.desc(Show.start_time), db.desc(Show.id)).limit(SHOWS_PER_PAGE + 1).all()
+
+  next_cursor = None
+  if len(rows) > SHOWS_PER_PAGE:
+    rows = rows[:SHOWS_PER_PAGE]
+    next_cursor = encode_show_cursor(rows[-1][1], rows[-1][0])
+
+  data = ({
+        "venue_id": venue_id,
+        "venue_name": venue_name,
+        "artist_id": artist_id,
+        "artist_name": artist_name,
+        "artist_image_link": artist_image_link,
+        "start_time": start_time
+    } for _, start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link in rows)
+  return Response(stream_with_context(stream_template('pages/shows.html', shows=data, next_cursor=next_cursor)))
 
 @app.route('/shows/create')
 def create_shows():
@@ -481,10 +660,18 @@ def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO: insert form data as a new Show record in the db, instead
   try:
+    form = ShowForm()
+    if form.start_time.data is None:
+      raise ValueError('start_time is not a valid date and time')
+    # a shared lock on the watermark keeps a concurrent roll_show_counters()
+    # from passing this show's start_time before the show is committed
+    mark = counter_watermark(lock=True, shared=True)
     show = Show(artist_id=request.form['artist_id'], venue_id=request.form['venue_id'],
-                start_time=request.form['start_time'])
+                start_time=form.start_time.data)
 
     db.session.add(show)
+    db.session.flush()
+    count_show(show, mark.rolled_at)
     db.session.commit()
   # on successful db insert, flash success
     flash('Show was successfully listed!')
@@ -517,6 +704,25 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@app.cli.command('create-search-indexes')
+def create_search_indexes():
+    """Create the pg_trgm indexes behind venue and artist search."""
+    create_trigram_indexes(db, Venue, Artist)
+
+@app.cli.command('roll-show-counters')
+def roll_show_counters_command():
+    """Move shows that have started from the upcoming to the past counters."""
+    click.echo('{} shows rolled forward'.format(roll_show_counters()))
+
+@app.cli.command('rebuild-show-counters')
+def rebuild_show_counters_command():
+    """Recount upcoming and past shows for every venue and artist."""
+    rebuild_show_counters()
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
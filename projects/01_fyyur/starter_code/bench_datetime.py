@@ -0,0 +1,56 @@
+#----------------------------------------------------------------------------#
+# Micro-benchmark for the `datetime` Jinja filter.
+#
+#   python bench_datetime.py [rows] [distinct]
+#
+# Formats `rows` show times, drawn from `distinct` timestamps, the way a
+# shows page does: once with the previous filter (str() -> dateutil ->
+# babel) and once with filters.format_datetime, cold and warm.
+#----------------------------------------------------------------------------#
+
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+import filters
+
+
+def legacy_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+
+def main(rows=1000, distinct=200):
+  start = datetime(2019, 5, 21, 21, 30)
+  times = [start + timedelta(hours=7 * (i % distinct)) for i in range(rows)]
+  for t in times:
+    assert legacy_format_datetime(str(t), 'full') == filters.format_datetime(t, 'full')
+
+  def legacy():
+    for t in times:
+      legacy_format_datetime(str(t), 'full')
+
+  def cold():
+    filters._format.cache_clear()
+    for t in times:
+      filters.format_datetime(t, 'full')
+
+  def warm():
+    for t in times:
+      filters.format_datetime(t, 'full')
+
+  print('{} rows, {} distinct timestamps'.format(rows, distinct))
+  for name, fn in (('legacy', legacy), ('new (cold)', cold), ('new (warm)', warm)):
+    best = min(timeit.repeat(fn, number=1, repeat=5))
+    print('{:<12} {:>9.2f} us/call'.format(name, best / rows * 1e6))
+
+
+if __name__ == '__main__':
+  main(*(int(arg) for arg in sys.argv[1:3]))
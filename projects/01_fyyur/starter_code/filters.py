@@ -0,0 +1,43 @@
+from datetime import datetime
+from functools import lru_cache
+
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+#----------------------------------------------------------------------------#
+# Jinja filters.
+#----------------------------------------------------------------------------#
+
+# shorthand format names used by the templates
+FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+# distinct (timestamp, format, locale) results kept by format_datetime
+FORMAT_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=None)
+def compiled_pattern(format, locale):
+  # babel parses a pattern string into a DateTimePattern; keep one per
+  # (format, locale) along with the parsed Locale it is applied with
+  return babel.dates.parse_pattern(FORMATS.get(format, format)), Locale.parse(locale)
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def _format(value, format, locale):
+  if format in ('long', 'short'):
+    # babel's own named formats stitch a date and a time format together
+    return babel.dates.format_datetime(value, format, locale=locale)
+  pattern, locale = compiled_pattern(format, locale)
+  return pattern.apply(value, locale)
+
+
+def format_datetime(value, format='medium', locale=None):
+  # datetimes are formatted directly; strings are still accepted and
+  # parsed first for callers that only have the text form
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  return _format(value, format, locale or babel.dates.LC_TIME)
@@ -0,0 +1,26 @@
+"""add lower(name) indexes on Venue and Artist
+
+Revision ID: 5a0d8e3b6f12
+Revises: 3f1c2a9d7b41
+Create Date: 2026-10-18 12:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a0d8e3b6f12'
+down_revision = '3f1c2a9d7b41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venue_name_lower', 'Venue', [sa.text('lower(name)')], unique=False)
+    op.create_index('ix_artist_name_lower', 'Artist', [sa.text('lower(name)')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artist_name_lower', table_name='Artist')
+    op.drop_index('ix_venue_name_lower', table_name='Venue')
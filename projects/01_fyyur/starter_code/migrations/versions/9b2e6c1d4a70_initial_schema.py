@@ -0,0 +1,63 @@
+"""create the Venue, Artist and Show tables
+
+Revision ID: 9b2e6c1d4a70
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2e6c1d4a70'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the schema as it stood before there were migrations. Databases built
+    # then with db.create_all() already hold these tables, so only the
+    # missing ones are created.
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'Venue' not in existing:
+        op.create_table('Venue',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(), nullable=True),
+            sa.Column('city', sa.String(length=120), nullable=True),
+            sa.Column('state', sa.String(length=120), nullable=True),
+            sa.Column('address', sa.String(length=120), nullable=True),
+            sa.Column('phone', sa.String(length=120), nullable=True),
+            sa.Column('image_link', sa.String(length=500), nullable=True),
+            sa.Column('facebook_link', sa.String(length=120), nullable=True),
+            sa.Column('website', sa.String(length=250), nullable=True),
+            sa.Column('seeking_talent', sa.Boolean(), nullable=True),
+            sa.Column('seeking_description', sa.String(length=250), nullable=True),
+            sa.PrimaryKeyConstraint('id'))
+    if 'Artist' not in existing:
+        op.create_table('Artist',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(), nullable=True),
+            sa.Column('city', sa.String(length=120), nullable=True),
+            sa.Column('state', sa.String(length=120), nullable=True),
+            sa.Column('phone', sa.String(length=120), nullable=True),
+            sa.Column('genres', sa.String(length=120), nullable=True),
+            sa.Column('image_link', sa.String(length=500), nullable=True),
+            sa.Column('facebook_link', sa.String(length=120), nullable=True),
+            sa.PrimaryKeyConstraint('id'))
+    if 'Show' not in existing:
+        op.create_table('Show',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('artist_id', sa.Integer(), nullable=False),
+            sa.Column('venue_id', sa.Integer(), nullable=False),
+            sa.Column('start_time', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['artist_id'], ['Artist.id']),
+            sa.ForeignKeyConstraint(['venue_id'], ['Venue.id']),
+            sa.PrimaryKeyConstraint('id'))
+
+
+def downgrade():
+    op.drop_table('Show')
+    op.drop_table('Artist')
+    op.drop_table('Venue')
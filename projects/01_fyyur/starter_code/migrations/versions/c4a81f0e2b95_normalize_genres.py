@@ -0,0 +1,107 @@
+"""move artist and venue genres into the Genre table
+
+Revision ID: c4a81f0e2b95
+Revises: 9b2e6c1d4a70
+Create Date: 2026-10-18 12:10:00.000000
+
+"""
+import csv
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a81f0e2b95'
+down_revision = '9b2e6c1d4a70'
+branch_labels = None
+depends_on = None
+
+# owner table -> (association table, its owner column)
+LINKS = {
+    'Venue': ('venue_genres', 'venue_id'),
+    'Artist': ('artist_genres', 'artist_id'),
+}
+
+
+def split_genres(value):
+    # the genres column held the form's list as text: a PostgreSQL array
+    # literal ({Jazz,"Hip-Hop"}) when psycopg2 adapted the list, a JSON
+    # list, or a comma separated string
+    value = value.strip()
+    if value.startswith('['):
+        try:
+            return [str(name).strip() for name in json.loads(value)]
+        except ValueError:
+            pass
+    if value.startswith('{') and value.endswith('}'):
+        value = value[1:-1]
+    row = next(csv.reader([value], skipinitialspace=True, escapechar='\\'), [])
+    return [name.strip() for name in row]
+
+
+def upgrade():
+    op.create_table('Genre',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'))
+    for owner, (table, column) in LINKS.items():
+        op.create_table(table,
+            sa.Column(column, sa.Integer(), nullable=False),
+            sa.Column('genre_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint([column], [owner + '.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['genre_id'], ['Genre.id']),
+            sa.PrimaryKeyConstraint(column, 'genre_id'))
+        op.create_index('ix_{}_genre_id'.format(table), table, ['genre_id', column], unique=False)
+
+    # copy the genre strings into the new tables before their columns go.
+    # Only Artist had one in the original schema; a Venue column added by
+    # hand is carried over the same way.
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    owners = [owner for owner in LINKS
+              if 'genres' in [c['name'] for c in inspector.get_columns(owner)]]
+    tagged = {}
+    for owner in owners:
+        rows = bind.execute(sa.text(
+            'SELECT id, genres FROM "{}" WHERE genres IS NOT NULL'.format(owner))).fetchall()
+        tagged[owner] = [(id, [name for name in dict.fromkeys(split_genres(genres)) if name])
+                         for id, genres in rows]
+    names = sorted({name for rows in tagged.values() for _, genres in rows for name in genres})
+    genre = sa.table('Genre', sa.column('id', sa.Integer), sa.column('name', sa.String))
+    if names:
+        op.bulk_insert(genre, [{'name': name} for name in names])
+    ids = dict(bind.execute(sa.select([genre.c.name, genre.c.id])).fetchall())
+    for owner in owners:
+        table, column = LINKS[owner]
+        links = {(id, ids[name]) for id, genres in tagged[owner] for name in genres}
+        if links:
+            op.bulk_insert(sa.table(table, sa.column(column, sa.Integer), sa.column('genre_id', sa.Integer)),
+                           [{column: id, 'genre_id': genre_id} for id, genre_id in sorted(links)])
+        with op.batch_alter_table(owner) as batch_op:
+            batch_op.drop_column('genres')
+
+
+def downgrade():
+    # back to a comma separated Artist.genres; venues lose theirs, as the
+    # original schema had nowhere to keep them
+    op.add_column('Artist', sa.Column('genres', sa.String(length=120), nullable=True))
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        'SELECT artist_genres.artist_id, "Genre".name FROM artist_genres '
+        'JOIN "Genre" ON "Genre".id = artist_genres.genre_id '
+        'ORDER BY artist_genres.artist_id, "Genre".name')).fetchall()
+    genres = {}
+    for artist_id, name in rows:
+        genres.setdefault(artist_id, []).append(name)
+    if genres:
+        artist = sa.table('Artist', sa.column('id', sa.Integer), sa.column('genres', sa.String))
+        bind.execute(artist.update().where(artist.c.id == sa.bindparam('artist_id'))
+                     .values(genres=sa.bindparam('joined')),
+                     [{'artist_id': id, 'joined': ','.join(names)[:120]} for id, names in genres.items()])
+    for table, column in LINKS.values():
+        op.drop_index('ix_{}_genre_id'.format(table), table_name=table)
+        op.drop_table(table)
+    op.drop_table('Genre')
@@ -0,0 +1,61 @@
+"""add upcoming and past show counters to venues and artists
+
+Revision ID: e7d35a9c1f28
+Revises: c4a81f0e2b95
+Create Date: 2026-10-18 12:20:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7d35a9c1f28'
+down_revision = 'c4a81f0e2b95'
+branch_labels = None
+depends_on = None
+
+# owner table -> its column in Show
+OWNERS = {
+    'Venue': 'venue_id',
+    'Artist': 'artist_id',
+}
+
+
+def upgrade():
+    for owner in OWNERS:
+        op.add_column(owner, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(owner, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('ShowCounterWatermark',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('rolled_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'))
+
+    # the counters as of now, and the watermark at now, as
+    # rebuild_show_counters() leaves them
+    now = datetime.now()
+    bind = op.get_bind()
+    show = sa.table('Show', sa.column('id', sa.Integer), sa.column('venue_id', sa.Integer),
+                    sa.column('artist_id', sa.Integer), sa.column('start_time', sa.DateTime))
+    for owner, column in OWNERS.items():
+        table = sa.table(owner, sa.column('id', sa.Integer), sa.column('upcoming_shows_count', sa.Integer),
+                         sa.column('past_shows_count', sa.Integer))
+
+        def count(condition):
+            return sa.select([sa.func.count(show.c.id)]) \
+                .where(show.c[column] == table.c.id).where(condition).as_scalar()
+        bind.execute(table.update().values(
+            upcoming_shows_count=count(show.c.start_time > now),
+            past_shows_count=count(show.c.start_time <= now)))
+    op.bulk_insert(sa.table('ShowCounterWatermark', sa.column('id', sa.Integer), sa.column('rolled_at', sa.DateTime)),
+                   [{'id': 1, 'rolled_at': now}])
+
+
+def downgrade():
+    op.drop_table('ShowCounterWatermark')
+    for owner in OWNERS:
+        with op.batch_alter_table(owner) as batch_op:
+            batch_op.drop_column('past_shows_count')
+            batch_op.drop_column('upcoming_shows_count')
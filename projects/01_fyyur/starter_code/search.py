@@ -0,0 +1,80 @@
+import sys
+
+from sqlalchemy import func, text
+
+#----------------------------------------------------------------------------#
+# Name search for venues and artists.
+#----------------------------------------------------------------------------#
+
+# rows shown on a search results page; the count still covers every match
+SEARCH_LIMIT = 50
+TYPEAHEAD_LIMIT = 8
+
+
+def escape_like(term):
+  # a search for "100%" matches the literal text, not everything
+  return term.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+
+def create_trigram_indexes(db, *models):
+  # the lower(name) btree indexes declared on the models serve prefix
+  # lookups everywhere; on PostgreSQL substring searches also get a pg_trgm
+  # GIN index so ILIKE '%term%' does not scan the table
+  if db.engine.dialect.name != 'postgresql':
+    return
+  with db.engine.begin() as conn:
+    conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    for model in models:
+      conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS "ix_{0}_name_trgm" ON "{0}" USING gin (name gin_trgm_ops)'
+        .format(model.__tablename__)))
+
+
+def search_names(db, model, term, limit=SEARCH_LIMIT):
+  # case-insensitive substring search on model.name. The total number of
+  # matches rides along on every row as a window count, so the count and
+  # the first `limit` results come back in one query. Names starting with
+  # the term are listed first.
+  pattern = '%{}%'.format(escape_like(term))
+  rows = db.session.query(model.id, model.name, func.count().over()) \
+    .filter(model.name.ilike(pattern, escape='/')) \
+    .order_by(func.lower(model.name).like('{}%'.format(escape_like(term.lower())), escape='/').desc(),
+              model.name, model.id) \
+    .limit(limit).all()
+  return {
+    "count": rows[0][2] if rows else 0,
+    "data": [{"id": id, "name": name} for id, name, _ in rows],
+  }
+
+
+def prefix_upper_bound(prefix):
+  # the least string above every string starting with prefix: its last
+  # character that has a successor, bumped, with what follows dropped.
+  # None when every character is U+10FFFF. Surrogates are skipped, as they
+  # cannot be sent to the database.
+  stem = prefix.rstrip(chr(sys.maxunicode))
+  if not stem:
+    return None
+  following = ord(stem[-1]) + 1
+  if 0xD800 <= following <= 0xDFFF:
+    following = 0xE000
+  return stem[:-1] + chr(following)
+
+
+def prefix_names(db, model, term, limit=TYPEAHEAD_LIMIT):
+  # names starting with term, for autocomplete. The half-open range on
+  # lower(name) is what lets the ix_*_name_lower index drive the lookup;
+  # the LIKE rechecks it under collations that do not sort bytewise.
+  prefix = term.lower()
+  if not prefix:
+    return []
+  lowered = func.lower(model.name)
+  bounds = [lowered >= prefix]
+  upper = prefix_upper_bound(prefix)
+  if upper is not None:
+    bounds.append(lowered < upper)
+  rows = db.session.query(model.id, model.name) \
+    .filter(*bounds, lowered.like('{}%'.format(escape_like(prefix)), escape='/')) \
+    .order_by(lowered, model.id) \
+    .limit(limit).all()
+  return [{"id": id, "name": name} for id, name in rows]
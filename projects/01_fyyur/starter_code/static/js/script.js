@@ -2,3 +2,24 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// fill the search box datalists from /search/typeahead as the user types
+document.addEventListener('input', function (e) {
+  var input = e.target;
+  var kind = input.getAttribute('data-typeahead');
+  if (!kind) return;
+  var term = input.value.trim();
+  var list = document.getElementById(input.getAttribute('list'));
+  if (!term) { list.innerHTML = ''; return; }
+  fetch('/search/typeahead?q=' + encodeURIComponent(term))
+    .then(function (response) { return response.json(); })
+    .then(function (data) {
+      if (input.value.trim() !== term) return;
+      list.innerHTML = '';
+      data[kind].forEach(function (item) {
+        var option = document.createElement('option');
+        option.value = item.name;
+        list.appendChild(option);
+      });
+    });
+});
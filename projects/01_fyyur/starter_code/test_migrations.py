@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+from flask_migrate import downgrade, upgrade
+from sqlalchemy import inspect
+
+from app import app, db
+from fsnd_common.database import configure_database
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Runs the Alembic revisions on an empty SQLite database, checking that
+# `flask db upgrade` builds the schema app.py expects from scratch.
+#
+#   python -m unittest test_migrations -v
+
+
+class MigrationTestCase(unittest.TestCase):
+    """Upgrades an empty database to head and back down"""
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        configure_database(app, db, 'sqlite:///' + os.path.join(self.tempdir.name, 'fyyur_migrations.db'))
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        self.tempdir.cleanup()
+
+    # test_upgrade_from_empty
+    def test_upgrade_from_empty(self):
+        with app.app_context():
+            upgrade(directory=MIGRATIONS)
+            inspector = inspect(db.engine)
+            tables = set(inspector.get_table_names()) - {'alembic_version'}
+            self.assertEqual(tables, set(db.metadata.tables))
+            for name, table in db.metadata.tables.items():
+                self.assertEqual({column['name'] for column in inspector.get_columns(name)},
+                                 set(table.columns.keys()), name)
+            indexes = {index['name'] for name in tables for index in inspector.get_indexes(name)}
+            self.assertLessEqual({'ix_show_venue_id_start_time', 'ix_show_artist_id_start_time',
+                                  'ix_show_start_time_id', 'ix_venue_state_city_name',
+                                  'ix_venue_genres_genre_id', 'ix_artist_genres_genre_id'}, indexes)
+            # expression indexes are not reflected, so look them up by name
+            expression_indexes = {name for name, in db.session.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '%lower(name)%'")}
+            self.assertEqual(expression_indexes, {'ix_venue_name_lower', 'ix_artist_name_lower'})
+
+    # test_downgrade_to_empty
+    def test_downgrade_to_empty(self):
+        with app.app_context():
+            upgrade(directory=MIGRATIONS)
+            downgrade(directory=MIGRATIONS, revision='base')
+
+            self.assertEqual(set(inspect(db.engine).get_table_names()), {'alembic_version'})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
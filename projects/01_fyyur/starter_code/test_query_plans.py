@@ -0,0 +1,209 @@
+import os
+import re
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import (app, db, Venue, Artist, Show, Genre, venue_genres, artist_genres,
+                 rebuild_show_counters, roll_show_counters)
+from fsnd_common.database import configure_database
+
+# Seeds a synthetic catalogue and checks, through EXPLAIN, that the queries
+# each view issues are answered from indexes rather than by scanning a large
+# table. Runs against a throwaway SQLite file by default; point
+# FYYUR_PLAN_DATABASE_URL at an empty PostgreSQL database to check its
+# planner instead (the tables in it are dropped and recreated).
+#
+#   python -m unittest test_query_plans -v
+
+DATABASE_URL = os.environ.get('FYYUR_PLAN_DATABASE_URL')
+VENUES = int(os.environ.get('FYYUR_PLAN_VENUES', 2000))
+ARTISTS = int(os.environ.get('FYYUR_PLAN_ARTISTS', 2000))
+SHOWS = int(os.environ.get('FYYUR_PLAN_SHOWS', 50000))
+GENRES = 20
+
+# tables large enough that a full scan of one is a regression
+LARGE_TABLES = {'Show', 'Venue', 'Artist', 'venue_genres', 'artist_genres'}
+
+
+def full_scans(dialect, plan):
+  # names of the large tables a query plan reads in full
+  if dialect == 'postgresql':
+    tables = re.findall(r'Seq Scan on "?(\w+)"?', plan)
+  else:
+    tables = [table for table, rest in re.findall(r'SCAN (\w+)(.*)', plan)
+              if 'USING INDEX' not in rest and 'USING COVERING INDEX' not in rest
+              and 'USING INTEGER PRIMARY KEY' not in rest]
+  return {table for table in tables if table in LARGE_TABLES}
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """Checks that the Fyyur views read the large tables through indexes"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = None
+        url = DATABASE_URL
+        if not url:
+            cls.tempdir = tempfile.TemporaryDirectory()
+            url = 'sqlite:///' + os.path.join(cls.tempdir.name, 'fyyur_plans.db')
+        configure_database(app, db, url)
+        app.config['TESTING'] = True
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            cls.seed()
+            cls.dialect = db.engine.dialect.name
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        if cls.tempdir is not None:
+            cls.tempdir.cleanup()
+
+    @classmethod
+    def seed(cls):
+        now = datetime.now()
+        conn = db.session.connection()
+        conn.execute(Genre.__table__.insert(), [{'name': 'Genre {}'.format(i)} for i in range(GENRES)])
+        conn.execute(Venue.__table__.insert(), [{
+            'name': 'Venue {}'.format(i),
+            'city': 'City {}'.format(i % 50),
+            'state': 'S{}'.format(i % 10),
+        } for i in range(VENUES)])
+        conn.execute(Artist.__table__.insert(), [{
+            'name': 'Artist {}'.format(i),
+            'city': 'City {}'.format(i % 50),
+            'state': 'S{}'.format(i % 10),
+        } for i in range(ARTISTS)])
+        conn.execute(venue_genres.insert(), [
+            {'venue_id': v, 'genre_id': g}
+            for v in range(1, VENUES + 1) for g in {v % GENRES + 1, (v * 7) % GENRES + 1}])
+        conn.execute(artist_genres.insert(), [
+            {'artist_id': a, 'genre_id': g}
+            for a in range(1, ARTISTS + 1) for g in {a % GENRES + 1, (a * 3) % GENRES + 1}])
+        conn.execute(Show.__table__.insert(), [{
+            'venue_id': i % VENUES + 1,
+            'artist_id': (i * 7) % ARTISTS + 1,
+            'start_time': now + timedelta(minutes=(i * 37) % (2 * 365 * 24 * 60) - 365 * 24 * 60),
+        } for i in range(SHOWS)])
+        db.session.commit()
+        rebuild_show_counters()
+        db.session.execute('ANALYZE')
+        db.session.commit()
+
+    def setUp(self):
+        self.client = app.test_client
+        self.statements = []
+        with app.app_context():
+            self.engine = db.engine
+        event.listen(self.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        event.remove(self.engine, 'before_cursor_execute', self.record)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            parameters = parameters[0]
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE')):
+            self.statements.append((statement, parameters))
+
+    def explain(self, statement, parameters):
+        prefix = 'EXPLAIN ' if self.dialect == 'postgresql' else 'EXPLAIN QUERY PLAN '
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(prefix + statement, parameters)
+            return '\n'.join(' '.join(str(col) for col in row) for row in cursor.fetchall())
+        finally:
+            connection.close()
+
+    def assertIndexed(self, uses=(), allowed=()):
+        # no recorded query may read a large table in full, except those in
+        # allowed, and every index in uses must show up in one of the plans
+        self.assertTrue(self.statements, 'no queries were recorded')
+        plans = []
+        for statement, parameters in self.statements:
+            plan = self.explain(statement, parameters)
+            plans.append(plan)
+            scanned = full_scans(self.dialect, plan) - set(allowed)
+            self.assertFalse(scanned, 'full scan of {} in:\n{}\n{}'.format(
+                ', '.join(sorted(scanned)), statement, plan))
+        for index in uses:
+            self.assertTrue(any(index in plan for plan in plans),
+                            '{} is not used by any of:\n{}'.format(index, '\n'.join(plans)))
+
+    # test_venues_listing_plan
+    def test_venues_listing_plan(self):
+        res = self.client().get('/venues')
+
+        self.assertEqual(res.status_code, 200)
+        # every venue is listed, so PostgreSQL may rightly read Venue in
+        # full and sort; SQLite must walk ix_venue_state_city_name
+        if self.dialect == 'postgresql':
+            self.assertIndexed(allowed={'Venue'})
+        else:
+            self.assertIndexed(uses={'ix_venue_state_city_name'})
+
+    # test_show_venue_plan
+    def test_show_venue_plan(self):
+        res = self.client().get('/venues/{}'.format(VENUES // 2))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIndexed(uses={'ix_show_venue_id_start_time'})
+
+    # test_show_artist_plan
+    def test_show_artist_plan(self):
+        res = self.client().get('/artists/{}'.format(ARTISTS // 2))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIndexed(uses={'ix_show_artist_id_start_time'})
+
+    # test_shows_pages_plan
+    def test_shows_pages_plan(self):
+        res = self.client().get('/shows')
+        cursor = re.search(r'before=([^"]+)"', res.get_data(as_text=True)).group(1)
+        res = self.client().get('/shows?before=' + cursor)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIndexed(uses={'ix_show_start_time_id'})
+
+    # test_genre_plan
+    def test_genre_plan(self):
+        res = self.client().get('/genres/Genre 3')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIndexed(uses={'ix_venue_genres_genre_id', 'ix_artist_genres_genre_id'})
+
+    # test_typeahead_plan
+    def test_typeahead_plan(self):
+        res = self.client().get('/search/typeahead?q=venue 12')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.get_json()['venues'])
+        self.assertIndexed(uses={'ix_venue_name_lower', 'ix_artist_name_lower'})
+
+    # test_typeahead_last_code_point
+    def test_typeahead_last_code_point(self):
+        for q in ('\U0010ffff', 'venue 1\U0010ffff', 'venue \ud7ff'):
+            res = self.client().get('/search/typeahead', query_string={'q': q})
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.get_json()['venues'], [])
+        self.assertIndexed(uses={'ix_venue_name_lower', 'ix_artist_name_lower'})
+
+    # test_roll_show_counters_plan
+    def test_roll_show_counters_plan(self):
+        with app.app_context():
+            roll_show_counters(datetime.now() + timedelta(days=1))
+
+        self.assertIndexed(uses={'ix_show_start_time_id'})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
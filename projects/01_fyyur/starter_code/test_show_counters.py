@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from app import app, db, Venue, Artist, counter_watermark, rebuild_show_counters, roll_show_counters
+from fsnd_common.database import configure_database
+
+# Checks the upcoming_shows_count / past_shows_count columns kept on venues
+# and artists against shows created through the form and rolled forward.
+#
+#   python -m unittest test_show_counters -v
+
+
+class ShowCounterTestCase(unittest.TestCase):
+    """Checks the show counters on a throwaway SQLite database"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        configure_database(app, db, 'sqlite:///' + os.path.join(cls.tempdir.name, 'fyyur_counters.db'))
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        cls.tempdir.cleanup()
+
+    def setUp(self):
+        self.client = app.test_client
+        self.now = datetime.now().replace(microsecond=0)
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            venue = Venue(name='The Musical Hop', city='San Francisco', state='CA')
+            artist = Artist(name='Guns N Petals', city='San Francisco', state='CA')
+            db.session.add_all([venue, artist])
+            db.session.commit()
+            self.venue_id, self.artist_id = venue.id, artist.id
+            rebuild_show_counters(self.now)
+
+    def create_show(self, start_time):
+        res = self.client().post('/shows/create', data={
+            'artist_id': self.artist_id,
+            'venue_id': self.venue_id,
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Show was successfully listed!', res.get_data(as_text=True))
+
+    def counters(self):
+        # (upcoming, past) of the venue and of the artist
+        with app.app_context():
+            return [(owner.upcoming_shows_count, owner.past_shows_count)
+                    for owner in (Venue.query.get(self.venue_id), Artist.query.get(self.artist_id))]
+
+    # test_create_upcoming_show
+    def test_create_upcoming_show(self):
+        self.create_show(self.now + timedelta(days=7))
+
+        self.assertEqual(self.counters(), [(1, 0), (1, 0)])
+
+    # test_create_past_show
+    def test_create_past_show(self):
+        self.create_show(self.now - timedelta(days=7))
+
+        self.assertEqual(self.counters(), [(0, 1), (0, 1)])
+
+    # test_roll_show_counters
+    def test_roll_show_counters(self):
+        self.create_show(self.now + timedelta(hours=1))
+        self.create_show(self.now + timedelta(days=2))
+        self.assertEqual(self.counters(), [(2, 0), (2, 0)])
+
+        rolled_at = self.now + timedelta(days=1)
+        with app.app_context():
+            self.assertEqual(roll_show_counters(rolled_at), 1)
+            self.assertEqual(counter_watermark().rolled_at, rolled_at)
+            # an earlier roll does not move the watermark back
+            self.assertEqual(roll_show_counters(self.now), 0)
+            self.assertEqual(counter_watermark().rolled_at, rolled_at)
+        self.assertEqual(self.counters(), [(1, 1), (1, 1)])
+
+        # a show created behind the watermark is already past
+        self.create_show(self.now + timedelta(hours=12))
+        self.assertEqual(self.counters(), [(1, 2), (1, 2)])
+
+    # test_rebuild_matches_rolled_counters
+    def test_rebuild_matches_rolled_counters(self):
+        for hours in (-30, -1, 1, 30, 50):
+            self.create_show(self.now + timedelta(hours=hours))
+        rolled_at = self.now + timedelta(days=1)
+        with app.app_context():
+            roll_show_counters(rolled_at)
+        rolled = self.counters()
+        with app.app_context():
+            rebuild_show_counters(rolled_at)
+
+        self.assertEqual(rolled, [(2, 3), (2, 3)])
+        self.assertEqual(self.counters(), rolled)
+
+    # test_roll_show_counters_command
+    def test_roll_show_counters_command(self):
+        # last rolled a day ago, so a show that started an hour ago is
+        # still counted as upcoming until the command runs
+        with app.app_context():
+            counter_watermark(lock=True).rolled_at = self.now - timedelta(days=1)
+            db.session.commit()
+        self.create_show(self.now - timedelta(hours=1))
+        self.assertEqual(self.counters(), [(1, 0), (1, 0)])
+        result = app.test_cli_runner().invoke(args=['roll-show-counters'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output, '1 shows rolled forward\n')
+        self.assertEqual(self.counters(), [(0, 1), (0, 1)])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
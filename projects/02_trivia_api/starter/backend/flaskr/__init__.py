@@ -1,10 +1,18 @@
+import codecs
 import os
-from flask import Flask, request, abort, jsonify
+import click
+from flask import Flask, request, abort, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
+from sqlalchemy.exc import SQLAlchemyError
 
 from models import setup_db, Question, Category, db
+from .bulk import MIMETYPES, ImportFailed, export_questions, import_questions
+from .categories import category_cache
+from .counts import question_counts
+from .pagination import paginate
+from .quiz import draw_question, question_pool
+from .search import question_search
 
 QUESTIONS_PER_PAGE = 10
 
@@ -12,6 +20,8 @@ def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
   setup_db(app)
+  question_search.init_app(app)
+  question_counts.init_app(app)
   
   '''
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -27,26 +37,11 @@ def create_app(test_config=None):
     return response
 
 
-  '''
-  get_page_questions 
-  '''
-  def get_page_questions(request, selection):
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-
-    questions = [q.format() for q in selection]
-    current_qs = questions[start:end]
-    return current_qs
-  
   '''
   get_formatted_categories
   '''
   def get_formatted_categories():
-    categories = Category.query.order_by(Category.id).all()
-    categories = [c.format() for c in categories]
-    categories = {k: v for d in categories for k, v in d.items()}
-    return categories
+    return category_cache.categories()
 
   '''
   @TODO: 
@@ -55,12 +50,7 @@ def create_app(test_config=None):
   '''
   @app.route("/categories", methods=["GET"])
   def retrieve_categories():
-    categories = get_formatted_categories()
-    return jsonify({
-      'success': True,
-      'categories': categories,
-      'current_category': None,
-      })
+    return app.response_class(category_cache.response_body(), mimetype='application/json')
 
   '''
   @TODO: 
@@ -75,17 +65,20 @@ def create_app(test_config=None):
   '''
   @app.route("/questions", methods=["GET"])
   def retrieve_questions():
-    selection = Question.query.order_by(Question.id).all()
-    current_qs = get_page_questions(request, selection)
-    if len(current_qs) == 0:
+    try:
+      selection, next_cursor = paginate(Question.query, Question.id, request, QUESTIONS_PER_PAGE)
+    except ValueError:
+      abort(400)
+    if len(selection) == 0:
       abort(404)
 
     categories = get_formatted_categories()
 
     return jsonify({
       'success': True,
-      'questions': current_qs,
-      'total_questions': len(selection),
+      'questions': [q.format() for q in selection],
+      'total_questions': question_counts.total(Question),
+      'next_cursor': next_cursor,
       'categories': categories,
       'current_category': None,
       })
@@ -98,8 +91,12 @@ def create_app(test_config=None):
   '''
   @app.route("/questions/<int:qid>", methods=["DELETE"])
   def delete_question(qid):
-    q = Question.query.filter(Question.id==qid).delete()
-    db.session.commit()
+    question = Question.query.get(qid)
+    if question is not None:
+      question.delete()
+      question_counts.invalidate()
+      question_search.removed(question)
+      question_pool.removed(question)
     return jsonify({
       'success': True,
       'id': qid,
@@ -119,8 +116,10 @@ def create_app(test_config=None):
     try:
       body = request.get_json()
       new_q = Question(**body)
-      db.session.add(new_q)
-      db.session.commit()
+      new_q.insert()
+      question_counts.invalidate()
+      question_search.added(new_q)
+      question_pool.added(new_q)
 
       return jsonify({
         'success': True,
@@ -129,6 +128,74 @@ def create_app(test_config=None):
     except:
       abort(422)
 
+  '''
+  Bulk import and export.
+  POST /questions/bulk takes NDJSON (or CSV with Content-Type: text/csv),
+  one question per line, and reports the lines it could not import.
+  GET /questions/export?format=ndjson|csv streams every question back.
+  The same pipeline is available as `flask import-questions` / `flask export-questions`.
+  '''
+  @app.route("/questions/bulk", methods=["POST"])
+  def bulk_import_questions():
+    fmt = 'csv' if request.mimetype == MIMETYPES['csv'] else 'ndjson'
+    try:
+      result = import_questions(codecs.iterdecode(request.stream, 'utf-8'), fmt)
+    except ImportFailed as e:
+      return jsonify({
+        'success': False,
+        'error': 422,
+        'message': "Unprocessable entity",
+        'inserted': 0,
+        'line': e.line,
+        'reason': e.reason,
+        }), 422
+
+    return jsonify({
+      'success': True,
+      'inserted': result['inserted'],
+      'failed': result['failed'],
+      'errors': result['errors'],
+      })
+
+  @app.route("/questions/export", methods=["GET"])
+  def bulk_export_questions():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in MIMETYPES:
+      abort(400)
+    return app.response_class(stream_with_context(export_questions(fmt)), mimetype=MIMETYPES[fmt])
+
+  @app.cli.command('import-questions')
+  @click.argument('source', type=click.File('r', encoding='utf-8'))
+  @click.option('--format', 'fmt', type=click.Choice(list(MIMETYPES)),
+                help='Defaults to csv for .csv files and ndjson otherwise.')
+  def import_questions_command(source, fmt):
+    '''Load questions from an NDJSON or CSV file ('-' reads stdin).'''
+    fmt = fmt or ('csv' if source.name.endswith('.csv') else 'ndjson')
+    try:
+      result = import_questions(source, fmt)
+    except ImportFailed as e:
+      raise click.ClickException('{}; nothing was imported'.format(e))
+    for error in result['errors']:
+      click.echo('line {line}: {error}'.format(**error), err=True)
+    click.echo('{} inserted, {} failed'.format(result['inserted'], result['failed']))
+
+  @app.cli.command('export-questions')
+  @click.argument('target', type=click.File('w', encoding='utf-8'), default='-')
+  @click.option('--format', 'fmt', type=click.Choice(list(MIMETYPES)), default='ndjson')
+  def export_questions_command(target, fmt):
+    '''Write every question as NDJSON or CSV ('-' writes stdout).'''
+    for chunk in export_questions(fmt):
+      target.write(chunk)
+
+  @app.cli.command('create-search-indexes')
+  def create_search_indexes_command():
+    '''Create the pg_trgm index behind question search.'''
+    try:
+      created = question_search.create_index()
+    except SQLAlchemyError as e:
+      raise click.ClickException('could not create the search index: {}'.format(e))
+    click.echo('search index ready' if created else 'nothing to do: search is only indexed on PostgreSQL')
+
   '''
   @TODO: 
   Create a POST endpoint to get questions based on a search term. 
@@ -141,14 +208,17 @@ def create_app(test_config=None):
   @app.route("/questions/search", methods=["POST"])
   def search_questions():
     search_term = request.get_json()['searchTerm']
-    selection = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
-    current_qs = get_page_questions(request, selection)
-
+    if search_term is None:
+      search_term = ''
+    if not isinstance(search_term, str):
+      abort(400)
+    page = request.args.get('page', 1, type=int)
+    selection, total = question_search.search(search_term, page, QUESTIONS_PER_PAGE)
 
     return jsonify({
       'success': True,
-      'questions': current_qs,
-      'total_questions': len(selection),
+      'questions': [q.format() for q in selection],
+      'total_questions': total,
       'current_category': None,
     })
 
@@ -161,15 +231,19 @@ def create_app(test_config=None):
   '''
   @app.route("/categories/<int:cid>/questions", methods=["GET"])
   def retrieve_category_questions(cid):
-    selection = Question.query.filter(Question.category==cid).all()
-    current_qs = get_page_questions(request, selection)
-    if len(current_qs) == 0:
+    query = Question.query.filter(Question.category==cid)
+    try:
+      selection, next_cursor = paginate(query, Question.id, request, QUESTIONS_PER_PAGE)
+    except ValueError:
+      abort(400)
+    if len(selection) == 0:
       abort(404)
 
     return jsonify({
       'success': True,
-      'questions': current_qs,
-      'total_questions': len(selection),
+      'questions': [q.format() for q in selection],
+      'total_questions': question_counts.exact(('category', cid), query.count),
+      'next_cursor': next_cursor,
       'current_category': cid
       })
 
@@ -190,23 +264,12 @@ def create_app(test_config=None):
       body = request.get_json()
       prev_qs = body['previous_questions']
       cid = body['quiz_category']['id']
-      print(prev_qs, cid)
-
-      if cid == 0:
-        selection = Question.query.filter(Question.id.notin_(prev_qs)).all()
-      else:
-        selection = Question.query.filter(Question.category==cid, Question.id.notin_(prev_qs)).all()
-      
-      current_qs = [q.format() for q in selection]
-
-      if selection:
-        q = current_qs[random.randint(0, len(selection)-1)]
-      else:
-        q = None
+      q, session = draw_question(cid, prev_qs, body.get('quiz_session'))
 
       return jsonify({
         'success': True,
-        'question': q,
+        'question': q.format() if q else None,
+        'quiz_session': session,
         })
 
     except:
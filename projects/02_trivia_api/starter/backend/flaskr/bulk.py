@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+
+from models import Question, bump_question_versions, db
+from .categories import category_cache
+from .counts import question_counts
+
+BATCH_SIZE = 5000
+# per-row errors echoed back to the client; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+FIELDS = ('question', 'answer', 'category', 'difficulty')
+MIMETYPES = {
+  'ndjson': 'application/x-ndjson',
+  'csv': 'text/csv',
+}
+
+'''
+read_rows(lines, fmt)
+    yields (line number, row dict) from NDJSON or CSV text lines, or
+    (line number, ValueError) for a line that does not parse
+'''
+def read_rows(lines, fmt):
+  if fmt == 'csv':
+    reader = csv.DictReader(lines)
+    for row in reader:
+      yield reader.line_num, row
+    return
+  for number, line in enumerate(lines, 1):
+    if not line.strip():
+      continue
+    try:
+      row = json.loads(line)
+    except ValueError as e:
+      yield number, ValueError('invalid JSON: {}'.format(e))
+      continue
+    if not isinstance(row, dict):
+      yield number, ValueError('expected a JSON object')
+      continue
+    yield number, row
+
+'''
+validate_row(row, categories)
+    returns the insert parameters for a question row, raises ValueError
+'''
+def validate_row(row, categories):
+  missing = [f for f in FIELDS if row.get(f) in (None, '')]
+  if missing:
+    raise ValueError('missing {}'.format(', '.join(missing)))
+  try:
+    category = int(row['category'])
+    difficulty = int(row['difficulty'])
+  except (TypeError, ValueError):
+    raise ValueError('category and difficulty must be integers')
+  if category not in categories:
+    raise ValueError('unknown category {}'.format(category))
+  if not 1 <= difficulty <= 5:
+    raise ValueError('difficulty must be between 1 and 5')
+  return {
+    'question': str(row['question']),
+    'answer': str(row['answer']),
+    'category': str(category),
+    'difficulty': difficulty,
+  }
+
+'''
+ImportFailed
+    raised by import_questions when it cannot go on, after rolling back
+    everything it had written. line is where it stopped: the first line of
+    the batch being written, or the line it could not read.
+'''
+class ImportFailed(Exception):
+  def __init__(self, line, reason):
+    super().__init__('line {}: {}'.format(line, reason))
+    self.line = line
+    self.reason = reason
+
+'''
+write_batch(rows)
+    inserts validated rows in one statement: COPY on PostgreSQL,
+    executemany elsewhere, and bumps the question_versions counters of
+    their categories. The caller commits.
+'''
+def write_batch(rows):
+  if db.engine.dialect.name == 'postgresql':
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in rows:
+      writer.writerow([r[f] for f in FIELDS])
+    buf.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+      cursor.copy_expert('COPY questions ({}) FROM STDIN WITH (FORMAT csv)'.format(', '.join(FIELDS)), buf)
+    finally:
+      cursor.close()
+  else:
+    db.session.execute(Question.__table__.insert(), rows)
+  bump_question_versions(r['category'] for r in rows)
+
+'''
+import_questions(lines, fmt, batch_size)
+    streams rows into the questions table batch_size valid rows at a time,
+    all in one transaction: either every valid row is committed or, when
+    reading or writing fails partway, none is and ImportFailed is raised.
+    Invalid rows are skipped and reported by line number.
+'''
+def import_questions(lines, fmt='ndjson', batch_size=BATCH_SIZE):
+  categories = category_cache.categories()
+  inserted = 0
+  failed = 0
+  errors = []
+  batch = []
+  batch_line = None
+  writing = None
+  line = 0
+  try:
+    for number, row in read_rows(lines, fmt):
+      line = number
+      try:
+        if isinstance(row, ValueError):
+          raise row
+        batch.append(validate_row(row, categories))
+      except ValueError as e:
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+          errors.append({'line': number, 'error': str(e)})
+        continue
+      if batch_line is None:
+        batch_line = number
+      if len(batch) >= batch_size:
+        writing = batch_line
+        write_batch(batch)
+        inserted += len(batch)
+        batch, batch_line, writing = [], None, None
+    if batch:
+      writing = batch_line
+      write_batch(batch)
+      inserted += len(batch)
+    writing = line
+    db.session.commit()
+  except Exception as e:
+    db.session.rollback()
+    raise ImportFailed(writing if writing is not None else line + 1, str(getattr(e, 'orig', e)))
+
+  # the caches of questions themselves catch up from question_versions
+  if inserted:
+    question_counts.invalidate()
+
+  return {
+    'inserted': inserted,
+    'failed': failed,
+    'errors': errors,
+  }
+
+'''
+export_questions(fmt, batch_size)
+    yields the Question.format() representation of every question as NDJSON
+    lines or CSV rows, walking the table by id one batch at a time
+'''
+def export_questions(fmt='ndjson', batch_size=BATCH_SIZE):
+  columns = ('id',) + FIELDS
+  if fmt == 'csv':
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=columns)
+    writer.writeheader()
+    yield buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+
+  last_id = 0
+  while True:
+    batch = Question.query.filter(Question.id > last_id).order_by(Question.id).limit(batch_size).all()
+    if not batch:
+      return
+    last_id = batch[-1].id
+    if fmt == 'csv':
+      writer.writerows(q.format() for q in batch)
+      yield buf.getvalue()
+      buf.seek(0)
+      buf.truncate()
+    else:
+      yield ''.join(json.dumps(q.format()) + '\n' for q in batch)
+    db.session.expunge_all()
@@ -0,0 +1,54 @@
+import json
+import threading
+import time
+from sqlalchemy import event
+
+from models import Category
+
+'''
+CategoryCache
+    the {id: type} category map, built once per process and shared by every
+    create_app() instance. /categories is answered from JSON bytes rendered
+    when the map is built. The map expires after ttl seconds and is dropped
+    as soon as a Category row is written through the ORM.
+'''
+class CategoryCache:
+  def __init__(self, ttl=300):
+    self.ttl = ttl
+    self._lock = threading.Lock()
+    self._entry = None
+
+  def _get(self):
+    entry = self._entry
+    if entry is not None and time.monotonic() < entry[0]:
+      return entry
+    with self._lock:
+      entry = self._entry
+      if entry is None or time.monotonic() >= entry[0]:
+        categories = {c.id: c.type for c in Category.query.order_by(Category.id)}
+        body = json.dumps({
+          'success': True,
+          'categories': categories,
+          'current_category': None,
+          }).encode()
+        entry = (time.monotonic() + self.ttl, categories, body)
+        self._entry = entry
+    return entry
+
+  def categories(self):
+    return self._get()[1]
+
+  def response_body(self):
+    return self._get()[2]
+
+  def invalidate(self):
+    self._entry = None
+
+
+category_cache = CategoryCache()
+
+def _category_written(mapper, connection, target):
+  category_cache.invalidate()
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+  event.listen(Category, _event, _category_written)
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from sqlalchemy import text
+
+from models import QuestionVersion, db
+
+'''
+CountService
+    caches the COUNT(*) behind total_questions so the pager does not count
+    the table on every request. Counts are keyed by what they filter on:
+    ('all',), ('category', id) or ('search', term). Any question write calls
+    invalidate(), which drops every key since one row can change all of
+    them; the ttl bounds how long another worker's writes go unnoticed.
+
+    With APPROXIMATE_COUNTS (or TRIVIA_APPROXIMATE_COUNTS=1) the unfiltered
+    total on PostgreSQL is read from the planner's pg_class.reltuples
+    estimate once the table holds more than approximate_threshold rows.
+'''
+class CountService:
+  def __init__(self, ttl=30, max_keys=10000, approximate_threshold=100000):
+    self.ttl = ttl
+    self.max_keys = max_keys
+    self.approximate_threshold = approximate_threshold
+    self.approximate = False
+    self._lock = threading.Lock()
+    self._entries = {}
+
+  def init_app(self, app):
+    default = os.environ.get('TRIVIA_APPROXIMATE_COUNTS') == '1'
+    self.approximate = bool(app.config.get('APPROXIMATE_COUNTS', default))
+
+  '''
+  exact(key, compute)
+      the cached count for key, calling compute() when it is missing or stale
+  '''
+  def exact(self, key, compute):
+    now = time.monotonic()
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and now < entry[0]:
+        return entry[1]
+    value = compute()
+    with self._lock:
+      self._entries.pop(key, None)
+      while len(self._entries) >= self.max_keys:
+        del self._entries[next(iter(self._entries))]
+      self._entries[key] = (now + self.ttl, value)
+    return value
+
+  '''
+  total(model)
+      the number of rows in model's table, estimated when approximate
+      counts are on and the table is large enough for it to matter
+  '''
+  def total(self, model):
+    if self.approximate and db.engine.dialect.name == 'postgresql':
+      estimate = self.exact(('estimate', model.__tablename__), lambda: self._reltuples(model))
+      if estimate >= self.approximate_threshold:
+        return estimate
+    return self.exact(('all', model.__tablename__), model.query.count)
+
+  def _reltuples(self, model):
+    estimate = db.session.execute(
+      text('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)'),
+      {'name': model.__tablename__}).scalar()
+    return estimate or 0
+
+  def invalidate(self):
+    with self._lock:
+      self._entries.clear()
+
+
+question_counts = CountService()
+
+'''
+QuestionsVersion
+    tells an in-process copy of the questions which categories have gone
+    stale, by comparing the question_versions counters it last saw with the
+    table's current ones (see models.bump_question_versions). That read is
+    one row per category, never a scan of questions, and runs at most once
+    every check_interval seconds however many requests poll.
+'''
+class QuestionsVersion:
+  def __init__(self, check_interval=1):
+    self.check_interval = check_interval
+    self._lock = threading.Lock()
+    self._seen = {}
+    self._checked = 0
+
+  '''
+  read()
+      the current counter of every category, to pass to loaded() once the
+      copy has been read after it
+  '''
+  def read(self):
+    return dict(db.session.query(QuestionVersion.category, QuestionVersion.version))
+
+  '''
+  loaded(versions, categories)
+      records that the copy of categories, every one by default, was read
+      after versions
+  '''
+  def loaded(self, versions, categories=None):
+    with self._lock:
+      if categories is None:
+        self._seen = dict(versions)
+        self._checked = time.monotonic()
+      else:
+        for category in categories:
+          self._seen[category] = versions.get(category, 0)
+
+  '''
+  changed(category)
+      records a write to category that the copy has already applied. The
+      write bumped the counter by exactly one, so the copy only counts as
+      stale if someone else bumped it too.
+  '''
+  def changed(self, category):
+    with self._lock:
+      category = str(category)
+      self._seen[category] = self._seen.get(category, 0) + 1
+
+  '''
+  poll()
+      (versions, categories whose counter moved since the copy saw it), or
+      None when the last check was under check_interval seconds ago
+  '''
+  def poll(self):
+    now = time.monotonic()
+    with self._lock:
+      if now - self._checked < self.check_interval:
+        return None
+      self._checked = now
+    versions = self.read()
+    with self._lock:
+      stale = {category for category, version in versions.items()
+               if self._seen.get(category, 0) != version}
+    return versions, stale
@@ -0,0 +1,47 @@
+import base64
+import binascii
+
+'''
+encode_cursor(last_id)
+    turns the key of the last row of a page into an opaque token
+    that the client sends back as ?cursor= to get the next page
+'''
+def encode_cursor(last_id):
+  return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+'''
+decode_cursor(cursor)
+    reverses encode_cursor, raises ValueError for a token we did not issue
+'''
+def decode_cursor(cursor):
+  padded = cursor + '=' * (-len(cursor) % 4)
+  try:
+    return int(base64.urlsafe_b64decode(padded.encode()).decode())
+  except (binascii.Error, UnicodeDecodeError, ValueError):
+    raise ValueError('invalid cursor')
+
+'''
+paginate(query, key, request, per_page)
+    pushes the page window into SQL instead of slicing a fully loaded list.
+    ?cursor=<token> seeks past the last seen key (key > last_id), which stays
+    cheap no matter how deep the client pages; ?page=N keeps working through
+    LIMIT/OFFSET. One extra row is fetched to know whether a next page exists.
+    returns (rows, next_cursor)
+'''
+def paginate(query, key, request, per_page):
+  query = query.order_by(key)
+  cursor = request.args.get('cursor')
+  if cursor:
+    query = query.filter(key > decode_cursor(cursor))
+  else:
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+      return [], None
+    query = query.offset((page - 1) * per_page)
+
+  rows = query.limit(per_page + 1).all()
+  next_cursor = None
+  if len(rows) > per_page:
+    rows = rows[:per_page]
+    next_cursor = encode_cursor(getattr(rows[-1], key.key))
+  return rows, next_cursor
@@ -0,0 +1,210 @@
+import random
+import secrets
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from collections import OrderedDict
+
+from models import Question, db
+from .counts import QuestionsVersion
+
+ALL_CATEGORIES = 0
+
+'''
+QuestionPool
+    ids of every question per category, in id order, held in memory so a
+    quiz draw never touches the questions table. The id tuples are replaced
+    rather than mutated on writes, so a draw can hold on to one without
+    locking. Questions added or deleted by other processes are picked up
+    through QuestionsVersion, as in search.TrigramIndex: only the
+    categories whose counter moved are read again, one indexed query each,
+    and outside the lock, so draws carry on meanwhile.
+'''
+class QuestionPool:
+  def __init__(self, check_interval=1):
+    self._lock = threading.Lock()
+    self._ids = None
+    self.version = QuestionsVersion(check_interval)
+
+  def _load(self):
+    versions = self.version.read()
+    grouped = {}
+    every = []
+    for qid, category in db.session.query(Question.id, Question.category).order_by(Question.id):
+      grouped.setdefault(str(category), []).append(qid)
+      every.append(qid)
+    self._ids = {k: tuple(v) for k, v in grouped.items()}
+    self._ids[ALL_CATEGORIES] = tuple(every)
+    self.version.loaded(versions)
+
+  def _reload(self, versions, categories):
+    fresh = {}
+    for category in categories:
+      query = db.session.query(Question.id).filter(Question.category == category).order_by(Question.id)
+      fresh[category] = tuple(qid for qid, in query)
+    with self._lock:
+      if self._ids is None:
+        return
+      ids = dict(self._ids)
+      ids.update(fresh)
+      del ids[ALL_CATEGORIES]
+      ids[ALL_CATEGORIES] = tuple(merge(*ids.values()))
+      self._ids = ids
+      self.version.loaded(versions, categories)
+
+  def ids(self, category):
+    polled = self.version.poll() if self._ids is not None else None
+    if polled is not None and polled[1]:
+      self._reload(*polled)
+    with self._lock:
+      if self._ids is None:
+        self._load()
+      return self._ids.get(ALL_CATEGORIES if category == ALL_CATEGORIES else str(category), ())
+
+  def added(self, question):
+    with self._lock:
+      if self._ids is not None:
+        for key in (str(question.category), ALL_CATEGORIES):
+          ids = self._ids.get(key, ())
+          i = bisect_left(ids, question.id)
+          self._ids[key] = ids[:i] + (question.id,) + ids[i:]
+      self.version.changed(question.category)
+
+  def discard(self, qid):
+    '''drops qid without recording a write, for a question found missing'''
+    with self._lock:
+      if self._ids is not None:
+        for key, ids in self._ids.items():
+          if qid in ids:
+            self._ids[key] = tuple(i for i in ids if i != qid)
+
+  def removed(self, question):
+    self.discard(question.id)
+    self.version.changed(question.category)
+
+  def invalidate(self):
+    with self._lock:
+      self._ids = None
+
+'''
+Deck
+    a lazily shuffled view of a sorted id tuple, less the ids in exclude:
+    each draw is one step of a Fisher-Yates shuffle over the ranks of the
+    ids left, with the swapped slots kept in a dict, and a rank maps back to
+    its id by bisecting the excluded positions. Dealing a deck costs
+    O(len(exclude) log n) and a draw O(log len(exclude)), whatever the
+    size of the category.
+'''
+class Deck:
+  def __init__(self, ids, exclude=()):
+    self.ids = ids
+    positions = set()
+    for qid in exclude:
+      if not isinstance(qid, int):
+        continue
+      i = bisect_left(ids, qid)
+      if i < len(ids) and ids[i] == qid:
+        positions.add(i)
+    # gaps[k]: how many kept ids come before the k-th excluded position
+    self.gaps = [p - k for k, p in enumerate(sorted(positions))]
+    self.remaining = len(ids) - len(positions)
+    self.swaps = {}
+    self.touched = time.monotonic()
+
+  def draw(self):
+    if self.remaining == 0:
+      return None
+    i = random.randrange(self.remaining)
+    last = self.remaining - 1
+    picked = self.swaps.get(i, i)
+    self.swaps[i] = self.swaps.get(last, last)
+    self.swaps.pop(last, None)
+    self.remaining = last
+    self.touched = time.monotonic()
+    return self.ids[picked + bisect_right(self.gaps, picked)]
+
+'''
+QuizDecks
+    one Deck per quiz session, keyed by the opaque quiz_session token the
+    client echoes back, least recently used first. Dealing a deck drops the
+    ones idle for longer than ttl, then the oldest beyond max_sessions.
+'''
+class QuizDecks:
+  def __init__(self, max_sessions=10000, ttl=3600):
+    self.max_sessions = max_sessions
+    self.ttl = ttl
+    self._lock = threading.Lock()
+    self._decks = OrderedDict()
+
+  def start(self, deck):
+    token = secrets.token_urlsafe(16)
+    now = time.monotonic()
+    with self._lock:
+      while self._decks and now - next(iter(self._decks.values())).touched > self.ttl:
+        self._decks.popitem(last=False)
+      self._decks[token] = deck
+      while len(self._decks) > self.max_sessions:
+        self._decks.popitem(last=False)
+    return token
+
+  def __len__(self):
+    return len(self._decks)
+
+  def _live(self, token):
+    deck = self._decks.get(token)
+    if deck is not None and time.monotonic() - deck.touched > self.ttl:
+      del self._decks[token]
+      deck = None
+    return deck
+
+  def active(self, token):
+    with self._lock:
+      return token is not None and self._live(token) is not None
+
+  def draw(self, token):
+    '''returns the next id, or None once the deck is spent or has expired'''
+    with self._lock:
+      deck = self._live(token)
+      if deck is None:
+        return None
+      self._decks.move_to_end(token)
+      return deck.draw()
+
+
+question_pool = QuestionPool()
+quiz_decks = QuizDecks()
+
+'''
+draw_question(category, previous_questions, session)
+    the next question of a quiz and the session token to send back.
+    A quiz starting without a live session (no previous_questions) is dealt
+    a new deck and its token. A request that has previous_questions but no
+    live session comes from a client that does not echo the token, so it
+    draws from a throwaway deck that leaves those questions out, and no
+    session is kept for it. In a live session, ids in previous_questions
+    the deck has not dealt are skipped as they come off it.
+    returns (question or None, session or None)
+'''
+def draw_question(category, previous_questions, session=None):
+  seen = set(previous_questions)
+  if quiz_decks.active(session):
+    draw = lambda: quiz_decks.draw(session)
+  elif seen:
+    session = None
+    draw = Deck(question_pool.ids(category), seen).draw
+  else:
+    session = quiz_decks.start(Deck(question_pool.ids(category)))
+    draw = lambda: quiz_decks.draw(session)
+  while True:
+    qid = draw()
+    if qid is None:
+      return None, session
+    if qid in seen:
+      continue
+    question = Question.query.get(qid)
+    if question is not None:
+      return question, session
+    # deleted since the pool was read; the deletion also bumped its
+    # category's counter, so the next poll reads that category again
+    question_pool.discard(qid)
@@ -0,0 +1,230 @@
+import logging
+import threading
+from sqlalchemy import func, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import Question, db
+from .counts import QuestionsVersion, question_counts
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_INDEX = 'ix_questions_question_trgm'
+
+'''
+trigrams(value)
+    the set of three character slices of a lowercased string
+'''
+def trigrams(value):
+  return {value[i:i + 3] for i in range(len(value) - 2)}
+
+'''
+escape_like(term)
+    escapes LIKE wildcards so a search for "100%" matches the literal text
+'''
+def escape_like(term):
+  return term.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+'''
+rank(term, value)
+    sort key for an in-process match: questions holding the term as a whole
+    word come first, then the ones where it appears earliest
+'''
+def rank(term, value):
+  position = value.find(term)
+  end = position + len(term)
+  whole_word = (position == 0 or not value[position - 1].isalnum()) and \
+    (end == len(value) or not value[end].isalnum())
+  return (not whole_word, position)
+
+'''
+TrigramIndex
+    in-process inverted index from trigram to question ids, used where the
+    database cannot index substring searches (SQLite). It is built on the
+    first search and kept current by add()/discard(); invalidate() forces a
+    rebuild. Writes made by other processes are picked up through
+    QuestionsVersion: the questions of each category whose counter moved
+    are read again, outside the lock, and swapped into the index.
+'''
+class TrigramIndex:
+  def __init__(self, check_interval=1):
+    self._lock = threading.Lock()
+    self._texts = None
+    self._postings = {}
+    self._members = {}
+    self.version = QuestionsVersion(check_interval)
+
+  def _index(self, qid, value, category):
+    self._texts[qid] = value
+    self._members.setdefault(str(category), set()).add(qid)
+    for gram in trigrams(value):
+      self._postings.setdefault(gram, set()).add(qid)
+
+  def _unindex(self, qid):
+    value = self._texts.pop(qid, None)
+    if value is None:
+      return
+    for members in self._members.values():
+      members.discard(qid)
+    for gram in trigrams(value):
+      ids = self._postings.get(gram)
+      if ids is not None:
+        ids.discard(qid)
+        if not ids:
+          del self._postings[gram]
+
+  def _load(self):
+    versions = self.version.read()
+    self._texts = {}
+    self._postings = {}
+    self._members = {}
+    for qid, value, category in db.session.query(Question.id, Question.question, Question.category):
+      self._index(qid, (value or '').lower(), category)
+    self.version.loaded(versions)
+
+  def _reload(self, versions, categories):
+    fresh = {category: db.session.query(Question.id, Question.question).filter(
+      Question.category == category).all() for category in categories}
+    with self._lock:
+      if self._texts is None:
+        return
+      for category, rows in fresh.items():
+        for qid in list(self._members.pop(category, ())):
+          self._unindex(qid)
+        for qid, value in rows:
+          self._unindex(qid)
+          self._index(qid, (value or '').lower(), category)
+      self.version.loaded(versions, categories)
+
+  def add(self, question):
+    with self._lock:
+      if self._texts is not None:
+        self._unindex(question.id)
+        self._index(question.id, (question.question or '').lower(), question.category)
+      self.version.changed(question.category)
+
+  def discard(self, question):
+    with self._lock:
+      if self._texts is not None:
+        self._unindex(question.id)
+      self.version.changed(question.category)
+
+  def invalidate(self):
+    with self._lock:
+      self._texts = None
+      self._postings = {}
+      self._members = {}
+
+  '''
+  lookup(term)
+      ids of every question containing term, best ranked first
+  '''
+  def lookup(self, term):
+    term = term.lower()
+    polled = self.version.poll() if self._texts is not None else None
+    if polled is not None and polled[1]:
+      self._reload(*polled)
+    with self._lock:
+      if self._texts is None:
+        self._load()
+      grams = sorted((self._postings.get(g, set()) for g in trigrams(term)), key=len)
+      if grams:
+        candidates = grams[0].intersection(*grams[1:])
+      else:
+        candidates = self._texts.keys()
+      matches = [(rank(term, self._texts[qid]), qid) for qid in candidates
+                 if term in self._texts[qid]]
+    matches.sort()
+    return [qid for _, qid in matches]
+
+'''
+QuestionSearch
+    substring search over Question.question that stays flat as the table
+    grows. PostgreSQL answers ILIKE '%term%' from a pg_trgm GIN index and
+    ranks by trigram similarity, with the match count cached by term;
+    other databases go through TrigramIndex.
+'''
+class QuestionSearch:
+  def __init__(self):
+    self.index = TrigramIndex()
+    self.dialect = None
+    self.trigram = False
+
+  '''
+  init_app(app)
+      detects the database and, on PostgreSQL, whether a valid trigram
+      index exists. It is created by `flask create-search-indexes`; without it
+      the search still works, unindexed.
+  '''
+  def init_app(self, app):
+    with app.app_context():
+      self.dialect = db.engine.dialect.name
+      if self.dialect != 'postgresql':
+        return
+      try:
+        # a failed CONCURRENTLY build leaves an index that is not valid
+        self.trigram = bool(db.session.execute(
+          text('SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'),
+          {'name': TRIGRAM_INDEX}).scalar())
+      except SQLAlchemyError:
+        logger.warning('could not look up %s', TRIGRAM_INDEX, exc_info=True)
+      finally:
+        db.session.remove()
+      if not self.trigram:
+        logger.warning('%s is missing, question search will scan the table; '
+                       'run flask create-search-indexes', TRIGRAM_INDEX)
+
+  '''
+  create_index()
+      creates pg_trgm and the trigram index on PostgreSQL. The index is
+      built CONCURRENTLY, outside a transaction, so writes to questions
+      carry on while it builds. Returns False on other databases.
+  '''
+  def create_index(self):
+    if db.engine.dialect.name != 'postgresql':
+      return False
+    with db.engine.connect() as conn:
+      conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+      conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+      conn.execute(text(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON questions '
+        'USING gin (question gin_trgm_ops)'.format(TRIGRAM_INDEX)))
+    self.trigram = True
+    return True
+
+  def added(self, question):
+    self.index.add(question)
+
+  def removed(self, question):
+    self.index.discard(question)
+
+  '''
+  search(term, page, per_page)
+      returns (questions, total) for one page of ranked matches
+  '''
+  def search(self, term, page, per_page):
+    if page < 1:
+      return [], 0
+    if self.dialect == 'postgresql':
+      return self._search_sql(term, page, per_page)
+    return self._search_index(term, page, per_page)
+
+  def _search_sql(self, term, page, per_page):
+    matches = Question.question.ilike('%{}%'.format(escape_like(term)), escape='/')
+    order = [Question.id]
+    if self.trigram:
+      order.insert(0, func.similarity(Question.question, term).desc())
+    query = Question.query.filter(matches)
+    rows = query.order_by(*order).offset((page - 1) * per_page).limit(per_page).all()
+    return rows, question_counts.exact(('search', term.lower()), query.count)
+
+  def _search_index(self, term, page, per_page):
+    ids = self.index.lookup(term)
+    start = (page - 1) * per_page
+    page_ids = ids[start:start + per_page]
+    if not page_ids:
+      return [], len(ids)
+    found = {q.id: q for q in Question.query.filter(Question.id.in_(page_ids))}
+    return [found[qid] for qid in page_ids if qid in found], len(ids)
+
+
+question_search = QuestionSearch()
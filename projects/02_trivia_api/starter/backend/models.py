@@ -1,8 +1,10 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, create_engine, text
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from fsnd_common.database import configure_database
+
 database_name = "trivia"
 database_path = "postgres://{}/{}".format('localhost:5432', database_name)
 
@@ -13,8 +15,7 @@ setup_db(app)
     binds a flask application and a SQLAlchemy service
 '''
 def setup_db(app, database_path=database_path):
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    configure_database(app, db, database_path)
     db.app = app
     db.init_app(app)
     db.create_all()
@@ -29,7 +30,8 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  # indexed for the per-category reloads of quiz.QuestionPool
+  category = Column(String, index=True)
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -40,13 +42,16 @@ class Question(db.Model):
 
   def insert(self):
     db.session.add(self)
+    bump_question_versions([self.category])
     db.session.commit()
   
   def update(self):
+    bump_question_versions([self.category])
     db.session.commit()
 
   def delete(self):
     db.session.delete(self)
+    bump_question_versions([self.category])
     db.session.commit()
 
   def format(self):
@@ -58,6 +63,33 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+'''
+QuestionVersion
+    a counter per question category, bumped in the same transaction as
+    every write to that category's questions. Workers holding questions in
+    memory read this small table to learn which categories changed, rather
+    than scanning questions.
+'''
+class QuestionVersion(db.Model):
+  __tablename__ = 'question_versions'
+
+  category = Column(String, primary_key=True)
+  version = Column(Integer, nullable=False)
+
+'''
+bump_question_versions(categories)
+    bumps the question_versions row of every category given, in the
+    current transaction; the caller commits. Writes that bypass Question's
+    methods, such as the bulk import, must call it as well.
+'''
+def bump_question_versions(categories):
+  # sorted, so concurrent writers lock the rows in the same order
+  for category in sorted({str(c) for c in categories}):
+    db.session.execute(text(
+      'INSERT INTO question_versions (category, version) VALUES (:category, 1) '
+      'ON CONFLICT (category) DO UPDATE SET version = question_versions.version + 1'),
+      {'category': category})
+
 '''
 Category
 
@@ -4,7 +4,9 @@ import json
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.quiz import question_pool, quiz_decks
+from flaskr.search import question_search
+from models import setup_db, Question, Category, bump_question_versions, db
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -41,6 +43,15 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['categories'])
 
+    # test_get_categories_map
+    def test_get_categories_map(self):
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['categories']['4'], 'History')
+        self.assertEqual(data, json.loads(self.client().get('/categories').data))
+
     # test_get_questions
     def test_get_questions(self):
         res = self.client().get('/questions')
@@ -51,6 +62,25 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'] > 0 )
         self.assertTrue(data['categories'])
 
+    # test_get_questions_cursor
+    def test_get_questions_cursor(self):
+        first = json.loads(self.client().get('/questions').data)
+        res = self.client().get('/questions?cursor=' + first['next_cursor'])
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['questions'])
+        self.assertTrue(data['questions'][0]['id'] > first['questions'][-1]['id'])
+        self.assertEqual(data['total_questions'], first['total_questions'])
+
+    # test_get_questions_bad_cursor
+    def test_get_questions_bad_cursor(self):
+        res = self.client().get('/questions?cursor=notacursor')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
     # test_delete_question
     def test_delete_question(self):
         res = self.client().delete('/questions/1')
@@ -62,6 +92,46 @@ class TriviaTestCase(unittest.TestCase):
 
         self.assertEqual(res.status_code, 200)
 
+    # test_bulk_import_questions
+    def test_bulk_import_questions(self):
+        rows = [
+            json.dumps({"question": "Bulk question", "answer": "yes", "category": 1, "difficulty": 1}),
+            json.dumps({"question": "No category", "answer": "no", "category": 99, "difficulty": 1}),
+        ]
+        res = self.client().post('/questions/bulk', data='\n'.join(rows), content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual(data['failed'], 1)
+        self.assertEqual(data['errors'][0]['line'], 2)
+
+    # test_bulk_import_questions_422
+    def test_bulk_import_questions_422(self):
+        with self.app.app_context():
+            before = Question.query.count()
+        row = json.dumps({"question": "Never imported", "answer": "no", "category": 1, "difficulty": 1})
+        body = (row + '\n' + row + '\n').encode() + b'\xff\xfe\n'
+        res = self.client().post('/questions/bulk', data=body, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['inserted'], 0)
+        self.assertEqual(data['line'], 3)
+        with self.app.app_context():
+            self.assertEqual(Question.query.count(), before)
+
+    # test_export_questions
+    def test_export_questions(self):
+        res = self.client().get('/questions/export')
+        lines = res.data.decode().splitlines()
+        total = json.loads(self.client().get('/questions').data)['total_questions']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(lines), total)
+        self.assertIn('question', json.loads(lines[0]))
+
     # test_questions_search
     def test_questions_search(self):
         res = self.client().post('/questions/search', json={"searchTerm": "title"})
@@ -71,6 +141,23 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'])
         self.assertEqual(data['total_questions'], 2)
 
+    # test_questions_search_case_insensitive
+    def test_questions_search_case_insensitive(self):
+        res = self.client().post('/questions/search', json={"searchTerm": "TITLE"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], 2)
+
+    # test_questions_search_past_last_page
+    def test_questions_search_past_last_page(self):
+        res = self.client().post('/questions/search?page=2', json={"searchTerm": "title"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['questions']), 0)
+        self.assertEqual(data['total_questions'], 2)
+
     # test_questions_search_notfound
     def test_questions_search_notfound(self):
         res = self.client().post('/questions/search', json={"searchTerm": "nodataexist"})
@@ -80,6 +167,46 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'], 0)
         self.assertEqual(len(data['questions']), 0)
 
+    # test_questions_search_null_term
+    def test_questions_search_null_term(self):
+        res = self.client().post('/questions/search', json={"searchTerm": None})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['questions'])
+
+    # test_questions_search_bad_term
+    def test_questions_search_bad_term(self):
+        res = self.client().post('/questions/search', json={"searchTerm": 5})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    # test_create_search_indexes
+    def test_create_search_indexes(self):
+        result = self.app.test_cli_runner().invoke(args=['create-search-indexes'])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        question_search.init_app(self.app)
+        self.assertTrue(question_search.trigram)
+
+    # test_questions_search_sees_other_writers
+    def test_questions_search_sees_other_writers(self):
+        question_search.index.version.check_interval = 0
+        self.client().post('/questions/search', json={"searchTerm": "zanzibar"})
+        # a row written by another worker, which bumps its category's counter
+        with self.app.app_context():
+            db.session.execute(Question.__table__.insert(), {
+                'question': 'Where is Zanzibar?', 'answer': 'Tanzania', 'category': '3', 'difficulty': 1})
+            bump_question_versions(['3'])
+            db.session.commit()
+        res = self.client().post('/questions/search', json={"searchTerm": "zanzibar"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([q['question'] for q in data['questions']], ['Where is Zanzibar?'])
+
     # test_category_questions
     def test_category_questions(self):
         res = self.client().get('/categories/5/questions')
@@ -89,6 +216,15 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'])
         self.assertTrue(data['total_questions'] > 0)
 
+    # test_category_questions_total
+    def test_category_questions_total(self):
+        res = self.client().get('/categories/5/questions?page=2')
+        first = json.loads(self.client().get('/categories/5/questions').data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(first['total_questions'], len(first['questions']))
+        self.assertIsNone(first['next_cursor'])
+
     # test_quizz_play
     def test_quizz_play(self):
         res = self.client().post('/quizzes', json={"previous_questions": [20], "quiz_category": {"type": "History", "id": 5}})
@@ -97,6 +233,49 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['question'])
 
+    # test_quizz_play_session
+    def test_quizz_play_session(self):
+        category = {"type": "History", "id": 4}
+        first = json.loads(self.client().post('/quizzes', json={"previous_questions": [], "quiz_category": category}).data)
+        res = self.client().post('/quizzes', json={"previous_questions": [first['question']['id']],
+                                                   "quiz_category": category,
+                                                   "quiz_session": first['quiz_session']})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['quiz_session'], first['quiz_session'])
+        self.assertNotEqual(data['question']['id'], first['question']['id'])
+
+    # test_quizz_play_without_session
+    def test_quizz_play_without_session(self):
+        before = len(quiz_decks)
+        for _ in range(5):
+            res = self.client().post('/quizzes', json={"previous_questions": [20], "quiz_category": {"type": "History", "id": 5}})
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertNotEqual(data['question']['id'], 20)
+            self.assertIsNone(data['quiz_session'])
+        self.assertEqual(len(quiz_decks), before)
+
+    # test_quizz_play_sees_other_writers
+    def test_quizz_play_sees_other_writers(self):
+        question_pool.version.check_interval = 0
+        category = {"type": "Art", "id": 2}
+        with self.app.app_context():
+            previous = [q.id for q in Question.query.filter(Question.category == '2')]
+            self.client().post('/quizzes', json={"previous_questions": previous[:1], "quiz_category": category})
+            # a row written by another worker, which bumps its category's counter
+            db.session.execute(Question.__table__.insert(), {
+                'question': 'Who painted Guernica?', 'answer': 'Picasso', 'category': '2', 'difficulty': 2})
+            bump_question_versions(['2'])
+            db.session.commit()
+        res = self.client().post('/quizzes', json={"previous_questions": previous, "quiz_category": category})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['question'], 'Who painted Guernica?')
+
     # test_get_questions_404
     def test_get_questions_404(self):
         res = self.client().get('/questions?page=500')
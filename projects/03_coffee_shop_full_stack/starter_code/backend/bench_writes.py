@@ -0,0 +1,106 @@
+'''
+Write latency under contention for the coffee shop database.
+
+    python bench_writes.py [writers] [writes per writer] [readers]
+
+Runs the same mix of drink INSERTs and UPDATEs from `writers` threads,
+while `readers` threads keep listing the drinks, against a scratch copy of
+the schema twice:
+
+    direct   rollback-journal sqlite, every thread committing its own
+             writes, as Drink.insert()/update() did through db.session
+    queued   WAL mode with apply_pragmas, writes submitted to a WriteQueue
+
+and reports write latency percentiles and the writes that failed.
+'''
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.exc import OperationalError
+
+from src.database.models import Drink
+from src.database.writer import WriteQueue, apply_pragmas
+
+table = Drink.__table__
+RECIPE = [{'color': 'brown', 'name': 'coffee', 'parts': 1}]
+
+
+def percentile(latencies, fraction):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+
+def run(name, engine, write, writers, count, readers):
+    latencies = []
+    failures = []
+    stop = threading.Event()
+
+    def writer(number):
+        for i in range(count):
+            title = 'drink {}-{}'.format(number, i)
+            start = time.perf_counter()
+            try:
+                id = write(lambda conn: conn.execute(
+                    table.insert().values(title=title, recipe=RECIPE)).inserted_primary_key[0])
+                write(lambda conn: conn.execute(
+                    table.update().where(table.c.id == id).values(title=title + ' v2')))
+            except OperationalError as error:
+                failures.append(error)
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    def reader():
+        while not stop.is_set():
+            with engine.connect() as conn:
+                conn.execute(select([table])).fetchall()
+            # a request's worth of pause, so readers do not just spin on the GIL
+            time.sleep(0.002)
+
+    reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for thread in reader_threads + writer_threads:
+        thread.start()
+    start = time.perf_counter()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in reader_threads:
+        thread.join()
+
+    if latencies:
+        print('{:<8} {:>8.1f} {:>8.1f} {:>8.1f} {:>10.0f} {:>8}'.format(
+            name, percentile(latencies, 0.5), percentile(latencies, 0.99), max(latencies) * 1000,
+            len(latencies) / elapsed, len(failures)))
+    else:
+        print('{:<8} every write failed: {}'.format(name, failures[0]))
+
+
+def main(writers=16, count=50, readers=4):
+    print('{} writers x {} insert+update pairs, {} readers'.format(writers, count, readers))
+    print('{:<8} {:>8} {:>8} {:>8} {:>10} {:>8}'.format('', 'p50 ms', 'p99 ms', 'max ms', 'pairs/sec', 'failed'))
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = 'sqlite:///' + os.path.join(tmp, 'direct.db')
+        engine = create_engine(uri)
+        table.create(engine)
+
+        def direct(job):
+            with engine.begin() as conn:
+                return job(conn)
+        run('direct', engine, direct, writers, count, readers)
+
+        uri = 'sqlite:///' + os.path.join(tmp, 'queued.db')
+        engine = create_engine(uri)
+        event.listen(engine, 'connect', apply_pragmas)
+        table.create(engine)
+        writes = WriteQueue(uri)
+        run('queued', engine, writes.submit, writers, count, readers)
+        writes.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:4]))
@@ -1,11 +1,13 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, Response, request, jsonify, abort
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
-from .auth.auth import AuthError, requires_auth
+from .database.models import db_drop_and_create_all, setup_db, valid_values, Drink
+from .database.batch import apply_batch, repeated, required_permissions, MAX_OPERATIONS
+from .auth.auth import AuthError, requires_auth, verified_payload, check_permissions
+from .menu_cache import drinks_menu
 
 app = Flask(__name__)
 setup_db(app)
@@ -26,20 +28,16 @@ CORS(app)
         it should contain only the drink.short() data representation
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
+    the body is served from drinks_menu with an ETag; a matching If-None-Match gets a 304
 '''
 @app.route('/drinks', methods=['GET'])
 def get_drinks():
-    try:
-        drinks_list = Drink.query.all()
-        if not drinks_list:
-            abort(400)
-        drinks = [drink.short() for drink in drinks_list]
-        return jsonify({
-            'success':True,
-            'drinks': drinks
-        }), 200
-    except Exception as error:
-        raise error
+    body, etag = drinks_menu.get(lambda: [drink.short() for drink in Drink.query.all()])
+    if body is None:
+        abort(400)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 '''
 @TODO implement endpoint
@@ -72,6 +70,7 @@ def get_drink_details(jwt):
         it should contain the drink.long() data representation
     returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the newly created drink
         or appropriate status code indicating reason for failure
+    a malformed title or recipe (see models.valid_values) is a 400, a missing recipe or a taken title a 422
 '''
 @app.route('/drinks', methods=['POST'])
 @requires_auth('post:drinks')
@@ -79,17 +78,24 @@ def create_drink(jwt):
     try:
         post_drink = request.get_json()
         title = json.loads(request.data)['title']
-        if title == '':
+        if title == '' or not valid_values(post_drink):
             abort(400)
         drink = Drink(
             title=post_drink.get('title'),
-            recipe=json.dumps(post_drink.get('recipe'))
+            recipe=post_drink.get('recipe')
         )
-        drink.insert()
-        return jsonify({
+        try:
+            drink.insert()
+        except exc.IntegrityError:
+            # no recipe, or a title already taken
+            abort(422)
+        drinks_menu.invalidate()
+        response = jsonify({
             'success':True,
             'drinks': drink.long()
-        }), 200
+        })
+        response.set_etag(str(drink.version))
+        return response, 200
     except Exception as error:
         raise error
 
@@ -103,29 +109,52 @@ def create_drink(jwt):
         it should contain the drink.long() data representation
     returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the updated drink
         or appropriate status code indicating reason for failure
+    only the title and/or recipe present in the body are written, in one UPDATE ... RETURNING,
+        after the same checks as a batch update: 400 for a malformed title or recipe,
+        422 for a title another drink has
+    with If-Match: "<version>" the drink is only updated while it is still at that version,
+        a 412 otherwise; the response's ETag is the new version
 '''
 @app.route('/drinks/<int:id>', methods=['PATCH'])
 @requires_auth('patch:drinks')
 def update_drinks(jwt, id):
+    request_body = request.get_json(force=True)
+    if not isinstance(request_body, dict):
+        abort(400)
+    values = {column: request_body[column] for column in ('title', 'recipe') if column in request_body}
+    if not values or not valid_values(values):
+        abort(400)
+    versions = if_match_versions()
     try:
-        drink = Drink.query.filter(Drink.id == id).one_or_none()
-        request_body = request.get_json()
-        if not drink:
-            abort(404)
-        title = json.loads(request.data)['title']
-        if title == '':
-            abort(400)
-        drink.title = title
-        if 'recipe' in request_body:
-            recipe = json.loads(request.data)['recipe']
-            drink.recipe = json.dumps(recipe)
-        drink.update()
-        return jsonify({
-            'success':True,
-            'drinks': drink.long()
-        }), 200
-    except Exception as error:
-        raise error
+        drink = Drink.patch(id, values, versions)
+    except exc.IntegrityError:
+        # a title another drink has
+        abort(422)
+    if drink is None:
+        if versions and Drink.query.filter(Drink.id == id).count():
+            abort(412)
+        abort(404)
+    drinks_menu.invalidate()
+    response = jsonify({
+        'success':True,
+        'drinks': drink.long()
+    })
+    response.set_etag(str(drink.version))
+    return response, 200
+
+'''
+if_match_versions()
+    the drink versions listed in the request's If-Match header, None when
+    it has none or is "*"; an entity tag that is not a version aborts 412
+'''
+def if_match_versions():
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    versions = [int(tag) for tag in if_match.as_set() if tag.isdigit()]
+    if not versions:
+        abort(412)
+    return versions
 
 '''
 @TODO implement endpoint
@@ -145,6 +174,7 @@ def delete_drink(jwt, id):
         if not drink:
             abort(404)
         drink.delete()
+        drinks_menu.invalidate()
         return jsonify({
             'success': True,
             'delete': id
@@ -152,6 +182,43 @@ def delete_drink(jwt, id):
     except Exception as error:
         raise error
 
+'''
+POST /drinks/batch
+    takes {"operations": [...]}, up to MAX_OPERATIONS drink creates, updates
+    and deletes (see database.batch.apply_batch), and applies them in one
+    transaction. The token is verified once and each distinct permission
+    the operations need is checked once; missing any of them rejects the
+    whole batch, as does naming one drink in more than one update or delete:
+    a 422 whose "operation" is the index of the repeating one.
+    returns status code 200 and json {"success": ok, "results": results}
+        where results holds, in order, what the single-drink endpoint would
+        have returned for each operation and ok is whether all succeeded
+'''
+@app.route('/drinks/batch', methods=['POST'])
+def batch_drinks():
+    payload = verified_payload()
+    request_body = request.get_json(force=True)
+    operations = request_body.get('operations') if isinstance(request_body, dict) else None
+    if not isinstance(operations, list) or not operations or len(operations) > MAX_OPERATIONS:
+        abort(400)
+    for permission in sorted(required_permissions(operations)):
+        check_permissions(permission, payload)
+    index = repeated(operations)
+    if index is not None:
+        return jsonify({
+            'success': False,
+            'error': 422,
+            'message': 'unprocessable',
+            'operation': index
+        }), 422
+    results = apply_batch(operations)
+    if any(result['success'] for result in results):
+        drinks_menu.invalidate()
+    return jsonify({
+        'success': all(result['success'] for result in results),
+        'results': results
+    }), 200
+
 ## Error Handling
 '''
 Example error handling for unprocessable entity
@@ -210,6 +277,14 @@ def method_not_allowed(error):
     "message": "method not allowed"
     }), 405
 
+@app.errorhandler(412)
+def precondition_failed(error):
+    return jsonify({
+    "success": False, 
+    "error": 412,
+    "message": "precondition failed"
+    }), 412
+
 @app.errorhandler(500)
 def server_error(error):
     return jsonify({
@@ -0,0 +1,286 @@
+import asyncio
+import json
+from functools import wraps
+from quart import Quart, Response, request, jsonify, abort
+from quart_cors import cors
+from sqlalchemy import exc
+
+from .database.async_store import AsyncDrinkStore
+from .database.models import valid_values
+from .database.batch import apply_batch, repeated, required_permissions, MAX_OPERATIONS
+from .auth.auth import AuthError, check_permissions, get_token_auth_header, verified_tokens, verifier
+from .menu_cache import drinks_menu
+
+'''
+ASGI entry point
+    the routes of api.py served by Quart, for running under an ASGI server:
+
+        hypercorn src.asgi:app
+
+    Handlers are coroutines: the sqlite reads run on aiosqlite's thread,
+    and the writes and the JWKS fetch for an unknown kid in an executor, so
+    one process keeps serving other requests while those are in flight.
+    Writes go through the same writer queue as api.py's. Route semantics,
+    including If-Match and POST /drinks/batch, status codes and AuthError
+    bodies match api.py.
+'''
+# the same CORS policy as flask_cors' defaults in api.py
+app = cors(Quart(__name__), allow_origin='*', allow_headers=['*'],
+           allow_methods=['GET', 'HEAD', 'POST', 'OPTIONS', 'PUT', 'PATCH', 'DELETE'])
+drink_store = AsyncDrinkStore()
+
+
+@app.before_serving
+async def open_database():
+    await drink_store.connect()
+
+
+@app.after_serving
+async def close_database():
+    await drink_store.close()
+
+
+'''
+verified_payload()
+    the async counterpart of auth.verified_payload, sharing its verifier
+    and verified_tokens cache
+'''
+async def verified_payload():
+    token = get_token_auth_header(request.headers)
+    payload = verified_tokens.get(token)
+    if payload is None:
+        payload = await verifier.verify_async(token)
+        verified_tokens.put(token, payload)
+    return payload
+
+'''
+requires_auth(permission)
+    the async counterpart of auth.requires_auth
+'''
+def requires_auth(permission=''):
+    def requires_auth_decorator(f):
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            payload = await verified_payload()
+            check_permissions(permission, payload)
+            return await f(payload, *args, **kwargs)
+
+        return wrapper
+    return requires_auth_decorator
+
+
+async def json_body():
+    # the request body parsed as JSON whatever its Content-Type, as
+    # json.loads(request.data) does in api.py
+    try:
+        return json.loads(await request.get_data())
+    except ValueError:
+        abort(400)
+
+
+def if_match_versions():
+    # the drink versions listed in If-Match, as api.if_match_versions
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    versions = [int(tag) for tag in if_match.as_set() if tag.isdigit()]
+    if not versions:
+        abort(412)
+    return versions
+
+
+def drink_response(drink):
+    # drink.long() with its version as the ETag, as api.py answers writes
+    return jsonify({
+        'success': True,
+        'drinks': drink.long()
+    }), 200, {'ETag': '"{}"'.format(drink.version)}
+
+
+def etag_matches(etag):
+    # weak comparison with If-None-Match, as Response.make_conditional does
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or '"{}"'.format(etag) in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+
+
+## ROUTES
+'''
+GET /drinks
+    public; drink.short() for every drink, served from drinks_menu with an
+    ETag, and a 304 for a matching If-None-Match
+'''
+@app.route('/drinks', methods=['GET'])
+async def get_drinks():
+    async def build():
+        return [drink.short() for drink in await drink_store.all()]
+
+    body, etag = await drinks_menu.get_async(build)
+    if body is None:
+        abort(400)
+    headers = {'ETag': '"{}"'.format(etag)}
+    if etag_matches(etag):
+        return Response(b'', status=304, mimetype='application/json', headers=headers)
+    return Response(body, mimetype='application/json', headers=headers)
+
+'''
+GET /drinks-detail
+    requires 'get:drinks-detail'; drink.long() for every drink
+'''
+@app.route('/drinks-detail')
+@requires_auth('get:drinks-detail')
+async def get_drink_details(jwt):
+    drinks_list = await drink_store.all()
+    if not drinks_list:
+        abort(400)
+    return jsonify({
+        'success': True,
+        'drinks': [drink.long() for drink in drinks_list]
+    }), 200
+
+'''
+POST /drinks
+    requires 'post:drinks'; creates a drink and returns its drink.long()
+'''
+@app.route('/drinks', methods=['POST'])
+@requires_auth('post:drinks')
+async def create_drink(jwt):
+    post_drink = await json_body()
+    if post_drink['title'] == '' or not valid_values(post_drink):
+        abort(400)
+    try:
+        drink = await drink_store.insert(post_drink.get('title'), post_drink.get('recipe'))
+    except exc.IntegrityError:
+        abort(422)
+    drinks_menu.invalidate()
+    return drink_response(drink)
+
+'''
+PATCH /drinks/<id>
+    requires 'patch:drinks'; sets the title and/or recipe given of drink id
+    and returns its drink.long(), 400 for a malformed title or recipe, 404
+    when there is no such drink, 412 when it is no longer at a version
+    listed in If-Match and 422 for a title another drink has
+'''
+@app.route('/drinks/<int:id>', methods=['PATCH'])
+@requires_auth('patch:drinks')
+async def update_drinks(jwt, id):
+    request_body = await json_body()
+    if not isinstance(request_body, dict):
+        abort(400)
+    values = {column: request_body[column] for column in ('title', 'recipe') if column in request_body}
+    if not values or not valid_values(values):
+        abort(400)
+    versions = if_match_versions()
+    try:
+        drink = await drink_store.update(id, values, versions)
+    except exc.IntegrityError:
+        abort(422)
+    if drink is None:
+        if versions and await drink_store.get(id) is not None:
+            abort(412)
+        abort(404)
+    drinks_menu.invalidate()
+    return drink_response(drink)
+
+'''
+DELETE /drinks/<id>
+    requires 'delete:drinks'; deletes drink id, 404 when there is no such drink
+'''
+@app.route('/drinks/<int:id>', methods=['DELETE'])
+@requires_auth('delete:drinks')
+async def delete_drink(jwt, id):
+    if not await drink_store.delete(id):
+        abort(404)
+    drinks_menu.invalidate()
+    return jsonify({
+        'success': True,
+        'delete': id
+    }), 200
+
+'''
+POST /drinks/batch
+    the operations of api.batch_drinks, applied by database.batch on the
+    writer thread while the event loop waits in an executor
+'''
+@app.route('/drinks/batch', methods=['POST'])
+async def batch_drinks():
+    payload = await verified_payload()
+    request_body = await json_body()
+    operations = request_body.get('operations') if isinstance(request_body, dict) else None
+    if not isinstance(operations, list) or not operations or len(operations) > MAX_OPERATIONS:
+        abort(400)
+    for permission in sorted(required_permissions(operations)):
+        check_permissions(permission, payload)
+    index = repeated(operations)
+    if index is not None:
+        return jsonify({
+            'success': False,
+            'error': 422,
+            'message': 'unprocessable',
+            'operation': index
+        }), 422
+    results = await asyncio.get_event_loop().run_in_executor(None, apply_batch, operations)
+    if any(result['success'] for result in results):
+        drinks_menu.invalidate()
+    return jsonify({
+        'success': all(result['success'] for result in results),
+        'results': results
+    }), 200
+
+## Error Handling
+@app.errorhandler(422)
+async def unprocessable(error):
+    return jsonify({
+        "success": False,
+        "error": 422,
+        "message": "unprocessable"
+    }), 422
+
+@app.errorhandler(400)
+async def bad_request(error):
+    return jsonify({
+        "success": False,
+        "error": 400,
+        "message": "bad request"
+    }), 400
+
+@app.errorhandler(404)
+async def resource_not_found(error):
+    return jsonify({
+        "success": False,
+        "error": 404,
+        "message": "resource not found"
+    }), 404
+
+@app.errorhandler(405)
+async def method_not_allowed(error):
+    return jsonify({
+        "success": False,
+        "error": 405,
+        "message": "method not allowed"
+    }), 405
+
+@app.errorhandler(412)
+async def precondition_failed(error):
+    return jsonify({
+        "success": False,
+        "error": 412,
+        "message": "precondition failed"
+    }), 412
+
+@app.errorhandler(500)
+async def server_error(error):
+    return jsonify({
+        "success": False,
+        "error": 500,
+        "message": "Internal Server Error"
+    }), 500
+
+@app.errorhandler(AuthError)
+async def auth_error(err):
+    response = jsonify(err.error)
+    response.status_code = err.status_code
+    return response
@@ -1,51 +1,30 @@
-import json
+import os
 from flask import request, _request_ctx_stack
 from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
+
+from fsnd_common.jwks import JWKSStore, url_source
+from fsnd_common.jwt_verifier import AuthError, JWTVerifier, get_token_auth_header
+from .token_cache import VerifiedTokenCache
 
 
 AUTH0_DOMAIN = 'udacity-fsnd.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'dev'
+# AUTH0_JWKS_URL may point at a file:// key set or a stub server in tests
+JWKS_URL = os.environ.get('AUTH0_JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+# seconds of clock skew tolerated on exp and nbf
+JWT_LEEWAY = int(os.environ.get('AUTH0_JWT_LEEWAY', 0))
 
-## AuthError Exception
-'''
-AuthError Exception
-A standardized way to communicate auth failure modes
-'''
-class AuthError(Exception):
-    def __init__(self, error, status_code):
-        self.error = error
-        self.status_code = status_code
-
-
-## Auth Header
+jwks_store = JWKSStore(url_source(JWKS_URL))
+verifier = JWTVerifier(jwks_store, audience=API_AUDIENCE, issuer='https://' + AUTH0_DOMAIN + '/',
+                       algorithms=ALGORITHMS, leeway=JWT_LEEWAY)
+verified_tokens = VerifiedTokenCache(keys=jwks_store)
 
+## AuthError Exception and Auth Header
 '''
-@TODO implement get_token_auth_header() method
-    it should attempt to get the header from the request
-        it should raise an AuthError if no header is present
-    it should attempt to split bearer and the token
-        it should raise an AuthError if the header is malformed
-    return the token part of the header
+AuthError and get_token_auth_header() come from fsnd_common.jwt_verifier,
+shared with BasicFlaskAuth
 '''
-def get_token_auth_header():
-    header = request.headers.get('Authorization', None)
-    if header is None:
-        raise AuthError({
-            'code': 'invalid_header',
-            'description': 'no header is present'
-        }, 401)
-
-    parts = header.split()
-    if len(parts) == 2 and parts[0].lower() == 'bearer':
-        return parts[1]
-    else:
-        raise AuthError({
-            'code': 'invalid_header',
-            'description': 'the header is malformed'
-        }, 401)
 
 '''
 @TODO implement check_permissions(permission, payload) method
@@ -78,7 +57,8 @@ def check_permissions(permission, payload):
         token: a json web token (string)
 
     it should be an Auth0 token with key id (kid)
-    it should verify the token using Auth0 /.well-known/jwks.json
+    it should verify the token using Auth0 /.well-known/jwks.json,
+        with the key for its kid prepared once by the shared JWTVerifier
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
@@ -86,60 +66,30 @@ def check_permissions(permission, payload):
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-    unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
-    if 'kid' not in unverified_header:
-        raise AuthError({
-            'code': 'invalid_header',
-            'description': 'Authorization malformed.'
-        }, 401)
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
-    if rsa_key:
-        try:
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
-            )
-            return payload
-        except jwt.ExpiredSignatureError:
-            raise AuthError({
-                'code': 'token_expired',
-                'description': 'Token expired.'
-            }, 401)
-        except jwt.JWTClaimsError:
-            raise AuthError({
-                'code': 'invalid_claims',
-                'description': 'invalid claims'
-            }, 401)
-        except Exception:
-            raise AuthError({
-                'code': 'invalid_header',
-                'description': 'Unable to parse authentication token.'
-            }, 400)
-    raise AuthError({
-        'code': 'invalid_header',
-                'description': 'Unable to find the appropriate key.'
-    }, 400)
+    return verifier.verify(token)
+
+'''
+verified_payload()
+    the decoded payload of the current request's bearer token, from
+    verified_tokens when it holds this unexpired token, through
+    verify_decode_jwt otherwise
+'''
+def verified_payload():
+    token = get_token_auth_header()
+    payload = verified_tokens.get(token)
+    if payload is None:
+        payload = verify_decode_jwt(token)
+        verified_tokens.put(token, payload)
+    return payload
+
 '''
 @TODO implement @requires_auth(permission) decorator method
     @INPUTS
         permission: string permission (i.e. 'post:drink')
 
     it should use the get_token_auth_header method to get the token
-    it should use the verify_decode_jwt method to decode the jwt
+    it should use the verify_decode_jwt method to decode the jwt,
+        unless verified_tokens already holds the payload of this unexpired token
     it should use the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
 '''
@@ -147,8 +97,7 @@ def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
+            payload = verified_payload()
             check_permissions(permission, payload)
             return f(payload, *args, **kwargs)
 
@@ -0,0 +1,83 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+'''
+VerifiedTokenCache
+    a bounded LRU of payloads whose RS256 signature and claims have already
+    been verified, so a client repeating the same bearer token skips the RSA
+    check. Entries are keyed by the SHA-256 of the token, never the token
+    itself, and are dropped once the token's exp claim has passed. Tokens
+    without an exp claim are not cached.
+
+    Given the JWKSStore the tokens were verified against as keys, the cache
+    empties itself whenever that store's key set changes, so a token signed
+    with a revoked key is checked again, and rejected, after the store's next
+    refresh instead of being served until its exp.
+
+    hits and misses count lookups so the saving can be measured.
+'''
+class VerifiedTokenCache:
+    def __init__(self, maxsize=1024, keys=None):
+        self.maxsize = maxsize
+        self.keys = keys
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_version = None
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def _check_keys(self):
+        # called with the lock held
+        if self.keys is not None and self.keys.version != self._keys_version:
+            self._entries.clear()
+            self._keys_version = self.keys.version
+
+    '''
+    get(token)
+        the cached payload for token, or None when it has to be verified
+    '''
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            self._check_keys()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.time() < entry[0]:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, payload):
+        exp = payload.get('exp')
+        if not isinstance(exp, (int, float)):
+            return
+        key = self._key(token)
+        with self._lock:
+            self._check_keys()
+            self._entries[key] = (exp, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
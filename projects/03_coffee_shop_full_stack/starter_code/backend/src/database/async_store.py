@@ -0,0 +1,105 @@
+import asyncio
+import json
+from functools import partial
+
+import aiosqlite
+from sqlalchemy.engine.url import make_url
+
+from . import models
+from .models import Drink
+from .writer import BUSY_TIMEOUT
+
+table = Drink.__table__
+
+'''
+AsyncDrinkStore
+    the drink table of the sqlite database behind models.Drink for asyncio
+    servers. Reads go through aiosqlite, so queries run on its connection
+    thread while the event loop keeps serving other requests. Writes are
+    the same Drink.insert() and Drink.patch() api.py makes, and the same
+    delete, submitted to models.writes from the loop's default executor:
+    every process has one writer thread whichever app it serves.
+
+    The connection uses the same WAL settings as writer.apply_pragmas.
+    Rows come back as transient Drink objects, which keeps short() and
+    long() defined in one place.
+'''
+class AsyncDrinkStore:
+    def __init__(self):
+        self.conn = None
+
+    '''
+    connect()
+        opens the connection, first adding the version column to an older
+        database on the writer thread, as setup_db does before a request
+    '''
+    async def connect(self):
+        writes = models.setup_writes()
+        await self._write(writes.submit, models.add_version_column)
+        self.conn = await aiosqlite.connect(make_url(models.database_path).database, isolation_level=None)
+        for pragma in ('journal_mode=WAL', 'synchronous=NORMAL', 'busy_timeout={}'.format(BUSY_TIMEOUT)):
+            await self.conn.execute('PRAGMA ' + pragma)
+
+    '''
+    close()
+        closes the connection and stops the writer thread once the writes
+        submitted so far are committed
+    '''
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
+        await self._write(models.writes.close)
+
+    @staticmethod
+    async def _write(write, *args):
+        return await asyncio.get_event_loop().run_in_executor(None, partial(write, *args))
+
+    @staticmethod
+    def _drink(row):
+        return Drink(id=row[0], title=row[1], recipe=json.loads(row[2]), version=row[3])
+
+    '''
+    all()
+        every drink, in id order
+    '''
+    async def all(self):
+        async with self.conn.execute('SELECT id, title, recipe, version FROM drink ORDER BY id') as cursor:
+            return [self._drink(row) for row in await cursor.fetchall()]
+
+    '''
+    get(id)
+        the drink with id, or None
+    '''
+    async def get(self, id):
+        async with self.conn.execute('SELECT id, title, recipe, version FROM drink WHERE id = ?', (id,)) as cursor:
+            row = await cursor.fetchone()
+        return self._drink(row) if row is not None else None
+
+    '''
+    insert(title, recipe)
+        the new drink; raises sqlalchemy's IntegrityError for a duplicate
+        title or a missing recipe, like Drink.insert()
+    '''
+    async def insert(self, title, recipe):
+        drink = Drink(title=title, recipe=recipe)
+        await self._write(drink.insert)
+        return drink
+
+    '''
+    update(id, values, versions)
+        sets the columns in values (title, recipe) of drink id and bumps its
+        version, only while that is one of versions when they are given.
+        Returns the updated drink, or None when no drink matched.
+    '''
+    async def update(self, id, values, versions=None):
+        return await self._write(Drink.patch, id, values, versions)
+
+    '''
+    delete(id)
+        True when drink id existed and was deleted
+    '''
+    async def delete(self, id):
+        def job(connection):
+            return connection.execute(table.delete().where(table.c.id == id)).rowcount > 0
+        return await self._write(models.writes.submit, job)
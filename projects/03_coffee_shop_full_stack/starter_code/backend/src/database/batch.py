@@ -0,0 +1,189 @@
+from sqlalchemy import select, bindparam, or_
+from sqlalchemy.exc import IntegrityError
+
+from . import models
+from .models import Drink, valid_values
+
+# the permission each kind of batch operation requires
+PERMISSIONS = {
+    'create': 'post:drinks',
+    'update': 'patch:drinks',
+    'delete': 'delete:drinks',
+}
+# operations accepted in one batch at most
+MAX_OPERATIONS = 1000
+
+table = Drink.__table__
+
+
+def _error(status, message):
+    return {'success': False, 'error': status, 'message': message}
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _invalid(operation):
+    # the result for an operation that is malformed whatever the database
+    # holds, None when it can be applied
+    if not isinstance(operation, dict) or operation.get('op') not in PERMISSIONS:
+        return _error(400, 'bad request')
+    op = operation['op']
+    if op != 'create' and not _is_int(operation.get('id')):
+        return _error(400, 'bad request')
+    if 'version' in operation and not _is_int(operation['version']):
+        return _error(400, 'bad request')
+    if op == 'create' and ('title' not in operation or 'recipe' not in operation):
+        return _error(400, 'bad request')
+    if op == 'update' and 'title' not in operation and 'recipe' not in operation:
+        return _error(400, 'bad request')
+    if op != 'delete' and not valid_values(operation):
+        return _error(400, 'bad request')
+    return None
+
+
+'''
+required_permissions(operations)
+    the distinct permissions a batch of operations needs
+'''
+def required_permissions(operations):
+    return {PERMISSIONS[operation['op']] for operation in operations
+            if isinstance(operation, dict) and operation.get('op') in PERMISSIONS}
+
+
+'''
+repeated(operations)
+    the index of the first update or delete naming a drink that an earlier
+    operation of the batch also names, None when every drink appears once
+'''
+def repeated(operations):
+    seen = set()
+    for index, operation in enumerate(operations):
+        if isinstance(operation, dict) and operation.get('op') in ('update', 'delete'):
+            id = operation.get('id')
+            if _is_int(id):
+                if id in seen:
+                    return index
+                seen.add(id)
+    return None
+
+
+def _bulk(connection, indexes, statement, params, results):
+    # runs statement once over the params of every operation in indexes;
+    # when that violates a constraint, runs it per operation instead, each
+    # in its own savepoint, and records a 422 for those that fail. Returns
+    # the indexes applied.
+    if not indexes:
+        return []
+    try:
+        with connection.begin_nested():
+            connection.execute(statement, [params(index) for index in indexes])
+        return indexes
+    except IntegrityError:
+        applied = []
+        for index in indexes:
+            try:
+                with connection.begin_nested():
+                    connection.execute(statement, params(index))
+                applied.append(index)
+            except IntegrityError:
+                results[index] = _error(422, 'unprocessable')
+        return applied
+
+
+def _apply(connection, operations, results):
+    pending = [index for index, result in enumerate(results) if result is None]
+    by_op = {op: [index for index in pending if operations[index]['op'] == op] for op in PERMISSIONS}
+
+    # one read of the current versions, for 404 and 412, replayed in
+    # request order so later operations see earlier deletes and updates
+    ids = {operations[index]['id'] for index in by_op['update'] + by_op['delete']}
+    versions = {}
+    if ids:
+        versions = dict(connection.execute(
+            select([table.c.id, table.c.version]).where(table.c.id.in_(ids))).fetchall())
+    deletes, updates = [], []
+    for index in sorted(by_op['update'] + by_op['delete']):
+        operation = operations[index]
+        version = versions.get(operation['id'])
+        if version is None:
+            results[index] = _error(404, 'resource not found')
+        elif operation.get('version', version) != version:
+            results[index] = _error(412, 'precondition failed')
+        elif operation['op'] == 'delete':
+            del versions[operation['id']]
+            deletes.append(index)
+        else:
+            versions[operation['id']] = version + 1
+            updates.append(index)
+
+    # deletes first, then updates grouped by the columns they set, then
+    # creates: one executemany per group
+    delete = table.delete().where(table.c.id == bindparam('drink_id'))
+    for index in _bulk(connection, deletes, delete,
+                       lambda index: {'drink_id': operations[index]['id']}, results):
+        results[index] = {'success': True, 'delete': operations[index]['id']}
+
+    groups = {}
+    for index in updates:
+        columns = tuple(column for column in ('title', 'recipe') if column in operations[index])
+        groups.setdefault(columns, []).append(index)
+    updated = []
+    for columns, indexes in groups.items():
+        update = table.update().where(table.c.id == bindparam('drink_id')).values(
+            version=table.c.version + 1,
+            **{column: bindparam('new_' + column, type_=table.c[column].type) for column in columns})
+        updated += _bulk(connection, indexes, update, lambda index: dict(
+            {'new_' + column: operations[index][column] for column in columns},
+            drink_id=operations[index]['id']), results)
+
+    insert = table.insert().values(title=bindparam('new_title'),
+                                   recipe=bindparam('new_recipe', type_=table.c.recipe.type), version=1)
+    created = _bulk(connection, by_op['create'], insert, lambda index: {
+        'new_title': operations[index]['title'],
+        'new_recipe': operations[index]['recipe'],
+    }, results)
+
+    # the drinks written, read back in one query for their long() form
+    if updated or created:
+        rows = connection.execute(select([table]).where(or_(
+            table.c.id.in_({operations[index]['id'] for index in updated}),
+            table.c.title.in_({operations[index]['title'] for index in created})))).fetchall()
+        by_id = {row.id: row for row in rows}
+        by_title = {row.title: row for row in rows}
+        for index in updated:
+            row = by_id[operations[index]['id']]
+            results[index] = {'success': True, 'drinks': Drink(
+                id=row.id, title=row.title, recipe=row.recipe, version=row.version).long()}
+        for index in created:
+            row = by_title[operations[index]['title']]
+            results[index] = {'success': True, 'drinks': Drink(
+                id=row.id, title=row.title, recipe=row.recipe, version=row.version).long()}
+
+
+'''
+apply_batch(operations)
+    applies a list of drink operations in one transaction on the writer
+    thread and returns a result per operation, in order:
+
+        {"op": "create", "title": ..., "recipe": ...}
+        {"op": "update", "id": ..., "title": ..., "recipe": ..., "version": ...}
+        {"op": "delete", "id": ..., "version": ...}
+
+    A create needs both title and recipe, an update either, checked as
+    models.valid_values does, and version is an optional If-Match for
+    updates and deletes. Callers must reject batches in which repeated()
+    finds a drink named twice. Deletes run first, then updates, then
+    creates, each kind as bulk statements. An operation that is malformed
+    (400), names no drink (404), has a stale version (412) or breaks a
+    constraint such as a duplicate title (422) is skipped and reported in
+    its result; the others still commit. Results have the shape of the
+    single-drink endpoints' responses, an update's showing the drink as
+    the whole batch left it.
+'''
+def apply_batch(operations):
+    results = [_invalid(operation) for operation in operations]
+    if any(result is None for result in results):
+        models.writes.submit(lambda connection: _apply(connection, operations, results))
+    return results
@@ -1,23 +1,94 @@
 import os
-from sqlalchemy import Column, String, Integer
+import sqlite3
+import threading
+from sqlalchemy import Column, String, Integer, JSON, event, inspect, text, bindparam
+from sqlalchemy.dialects.postgresql import JSONB
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from fsnd_common.database import configure_database
+from .writer import WriteQueue, apply_pragmas
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
 
 db = SQLAlchemy()
+# the writer thread Drink writes go through, see writer.py
+writes = None
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    the database is switched to WAL mode on first connection, so reads
+    through db.session run concurrently with the writer thread
+    add_version_column runs before the app's first request rather than
+    here, so importing the app never writes to the database
 '''
 def setup_db(app):
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    global writes
+    configure_database(app, db, database_path)
     db.app = app
     db.init_app(app)
+    event.listen(db.engine, 'connect', apply_pragmas)
+    writes = WriteQueue(database_path)
+    schema_checked = []
+    schema_lock = threading.Lock()
+
+    @app.before_request
+    def upgrade_schema():
+        if schema_checked:
+            return
+        with schema_lock:
+            if not schema_checked:
+                add_version_column(db.engine)
+                schema_checked.append(True)
+
+'''
+setup_writes()
+    starts the writer queue for a server that does not call setup_db, such
+    as asgi.py, unless this process already has one
+'''
+def setup_writes():
+    global writes
+    if writes is None:
+        writes = WriteQueue(database_path)
+    return writes
+
+'''
+add_version_column(bind)
+    adds Drink.version, at 1 for every drink, to a database created before
+    drinks had one; does nothing otherwise. bind is an engine or, as a
+    writes job, a connection
+'''
+def add_version_column(bind):
+    if not bind.dialect.has_table(bind, 'drink'):
+        return
+    if 'version' not in [column['name'] for column in inspect(bind).get_columns('drink')]:
+        bind.execute('ALTER TABLE drink ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+
+'''
+valid_values(values)
+    whether the title and recipe in values, whichever are present, are ones
+    a Drink can hold: a non-empty string title, and a recipe that is a list
+    of ingredients, each with a string color, a number of parts and, in the
+    long form, a string name
+'''
+def valid_values(values):
+    if 'title' in values and (not isinstance(values['title'], str) or values['title'] == ''):
+        return False
+    if 'recipe' in values:
+        if not isinstance(values['recipe'], list):
+            return False
+        for ingredient in values['recipe']:
+            if not isinstance(ingredient, dict) or not isinstance(ingredient.get('color'), str):
+                return False
+            parts = ingredient.get('parts')
+            if not isinstance(parts, (int, float)) or isinstance(parts, bool):
+                return False
+            if 'name' in ingredient and not isinstance(ingredient['name'], str):
+                return False
+    return True
 
 '''
 db_drop_and_create_all()
@@ -38,46 +109,70 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
+    # the ingredients, stored as native JSON (JSONB on postgres, JSON text on sqlite);
+    # none_as_null makes a missing recipe SQL NULL, which NOT NULL rejects, not 'null'
+    # and loaded as python objects - assign the list itself, not a json string
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    recipe =  Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql'), nullable=False)
+    # bumped by every write; clients send it back in If-Match to update
+    # only the drink they last saw
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+
+    # memoized short()/long() projections, dropped when title, recipe or version is assigned
+    _short = None
+    _long = None
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
-        return {
+        if self._short is not None:
+            return self._short
+        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in self.recipe]
+        short = {
             'id': self.id,
             'title': self.title,
             'recipe': short_recipe
         }
+        if self.id is not None:
+            self._short = short
+        return short
 
     '''
     long()
         long form representation of the Drink model
     '''
     def long(self):
-        return {
+        if self._long is not None:
+            return self._long
+        long = {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe,
+            'version': self.version
         }
+        if self.id is not None:
+            self._long = long
+        return long
 
     '''
     insert()
         inserts a new model into a database
         the model must have a unique name
         the model must have a unique id or null id
+        the INSERT is committed by the writer thread before insert() returns
         EXAMPLE
             drink = Drink(title=req_title, recipe=req_recipe)
             drink.insert()
     '''
     def insert(self):
-        db.session.add(self)
-        db.session.commit()
+        table = Drink.__table__
+        self.version = 1
+        self.id = writes.submit(lambda connection: connection.execute(
+            table.insert().values(title=self.title, recipe=self.recipe, version=self.version)).inserted_primary_key[0])
 
     '''
     delete()
@@ -88,20 +183,78 @@ class Drink(db.Model):
             drink.delete()
     '''
     def delete(self):
-        db.session.delete(self)
-        db.session.commit()
+        table = Drink.__table__
+        writes.submit(lambda connection: connection.execute(table.delete().where(table.c.id == self.id)))
+        if self in db.session:
+            db.session.expunge(self)
 
     '''
     update()
         updates a new model into a database
         the model must exist in the database
+        only the attributes assigned since it was loaded are written
         EXAMPLE
             drink = Drink.query.filter(Drink.id == id).one_or_none()
             drink.title = 'Black Coffee'
             drink.update()
     '''
     def update(self):
-        db.session.commit()
+        table = Drink.__table__
+        values = {attr.key: attr.value for attr in inspect(self).attrs
+                  if attr.key != 'version' and attr.history.has_changes()}
+        if values:
+            writes.submit(lambda connection: connection.execute(
+                table.update().where(table.c.id == self.id).values(version=table.c.version + 1, **values)))
+            self.version += 1
+        # the session must not flush the same changes again
+        if self in db.session:
+            db.session.expunge(self)
+
+    '''
+    patch(id, values, versions)
+        writes the columns in values (title, recipe) of drink id and bumps
+        its version in a single UPDATE ... RETURNING, without loading the
+        drink first. With versions, the row is only updated while its
+        version is one of them.
+        returns the updated drink, or None when no row matched
+        EXAMPLE
+            drink = Drink.patch(id, {'title': 'Black Coffee'}, versions=[3])
+    '''
+    @classmethod
+    def patch(cls, id, values, versions=None):
+        table = cls.__table__
+        assignments = ''.join('{0} = :{0}, '.format(column) for column in values)
+        condition = 'id = :id' + (' AND version IN :versions' if versions else '')
+        update = 'UPDATE {} SET {}version = version + 1 WHERE {}'.format(table.name, assignments, condition)
+        binds = [bindparam(column, type_=table.c[column].type) for column in values]
+        params = dict(values, id=id)
+        if versions:
+            binds.append(bindparam('versions', expanding=True))
+            params['versions'] = list(versions)
+
+        def job(connection):
+            # RETURNING needs sqlite 3.35; older ones read the row back in
+            # the same transaction
+            if connection.dialect.name != 'sqlite' or sqlite3.sqlite_version_info >= (3, 35):
+                returning = text(update + ' RETURNING id, title, recipe, version').bindparams(*binds)
+                returning = returning.columns(table.c.id, table.c.title, table.c.recipe, table.c.version)
+                return connection.execute(returning, params).first()
+            if connection.execute(text(update).bindparams(*binds), params).rowcount == 0:
+                return None
+            return connection.execute(table.select().where(table.c.id == id)).first()
+
+        row = writes.submit(job)
+        if row is None:
+            return None
+        return cls(id=row.id, title=row.title, recipe=row.recipe, version=row.version)
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return json.dumps(self.short())
+
+
+@event.listens_for(Drink.title, 'set')
+@event.listens_for(Drink.recipe, 'set')
+@event.listens_for(Drink.version, 'set')
+def _forget_projections(target, value, oldvalue, initiator):
+    target._short = None
+    target._long = None
@@ -0,0 +1,163 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+from sqlalchemy import create_engine, event
+
+# how long a connection waits on another process's write lock before
+# raising "database is locked", in milliseconds
+BUSY_TIMEOUT = 5000
+# jobs committed together by the writer thread at most
+MAX_BATCH = 64
+# queued by close() after the last job the writer thread commits
+_STOP = object()
+
+'''
+apply_pragmas(dbapi_connection, connection_record)
+    connect listener that puts the database in WAL mode, so readers never
+    wait on the writer, with synchronous=NORMAL (a commit appends to the
+    WAL without an fsync; only checkpoints sync) and a busy_timeout
+'''
+def apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout={}'.format(BUSY_TIMEOUT))
+    cursor.close()
+
+
+def _autocommit(dbapi_connection, connection_record):
+    # let SQLAlchemy emit BEGIN and SAVEPOINT itself; pysqlite's own
+    # transaction handling defers BEGIN and breaks savepoints
+    dbapi_connection.isolation_level = None
+
+
+def _begin_immediate(conn):
+    # take the write lock when the batch starts rather than on its first
+    # write, so a batch never fails halfway on a lock held by another process
+    conn.execute('BEGIN IMMEDIATE')
+
+
+'''
+WriteQueue
+    serializes the writes of this process on one writer thread.
+
+    submit(job) hands a callable taking a SQLAlchemy Connection to the
+    thread and blocks until it is committed. The thread drains up to
+    max_batch queued jobs into one BEGIN IMMEDIATE transaction, running each
+    in its own SAVEPOINT: a job that raises is rolled back alone and its
+    exception re-raised to its caller, while the rest of the batch commits.
+    Requests therefore never contend with each other for the sqlite write
+    lock, and under load many writes share one commit. Other processes
+    still take turns through busy_timeout.
+
+    close() stops the thread once the jobs queued before it are committed.
+'''
+class WriteQueue:
+    def __init__(self, database_uri, max_batch=MAX_BATCH):
+        self.max_batch = max_batch
+        self.engine = create_engine(database_uri)
+        event.listen(self.engine, 'connect', apply_pragmas)
+        event.listen(self.engine, 'connect', _autocommit)
+        event.listen(self.engine, 'begin', _begin_immediate)
+        self.batches = 0
+        self.jobs = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    '''
+    submit(job)
+        job(connection)'s return value once its batch has committed;
+        raises whatever job, or the commit, raised
+    '''
+    def submit(self, job):
+        future = Future()
+        with self._lock:
+            self._ensure_writer()
+            self._queue.put((job, future))
+        return future.result()
+
+    '''
+    close(timeout)
+        commits the jobs already submitted, then stops the writer thread and
+        closes its connection. A later submit() starts a new thread.
+    '''
+    def close(self, timeout=None):
+        with self._lock:
+            thread = self._thread
+            if thread is None or self._pid != os.getpid():
+                return
+            self._queue.put(_STOP)
+            self._thread = None
+        thread.join(timeout)
+        if not thread.is_alive():
+            self.engine.dispose()
+
+    def _ensure_writer(self):
+        # called with the lock held; threads do not survive a fork, so a
+        # pre-forking server gets one per worker
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._queue = queue.Queue()
+        self.engine.dispose()
+        self._thread = threading.Thread(target=self._run, args=(self._queue,), name='sqlite-writer', daemon=True)
+        self._thread.start()
+
+    def _next_batch(self, jobs):
+        batch = [jobs.get()]
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            try:
+                batch.append(jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, jobs):
+        connection = None
+        while True:
+            batch = self._next_batch(jobs)
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                connection = self._commit(connection, batch)
+            if stop:
+                if connection is not None:
+                    connection.close()
+                return
+
+    def _commit(self, connection, batch):
+        # runs batch in one transaction and settles its futures; returns the
+        # connection for the next batch
+        results = []
+        try:
+            if connection is None:
+                connection = self.engine.connect()
+            with connection.begin():
+                for job, future in batch:
+                    try:
+                        with connection.begin_nested():
+                            results.append((future, job(connection), None))
+                    except Exception as error:
+                        results.append((future, None, error))
+        except Exception as error:
+            # the connection or the commit failed: nothing in the batch
+            # was written, and the next batch starts on a new connection
+            if connection is not None:
+                connection.close()
+                connection = None
+            for job, future in batch:
+                future.set_exception(error)
+            return connection
+        self.batches += 1
+        self.jobs += len(batch)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        return connection
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import threading
+import time
+
+'''
+MenuCache
+    the serialized body of the public GET /drinks menu.
+
+    Every drink write calls invalidate(), which bumps version. The body and
+    its strong ETag (a hash of the body) are rendered once per version and
+    served until the next write, so a poll costs a version check and, with
+    a matching If-None-Match, an empty 304. The ttl bounds how long writes
+    made by other worker processes go unnoticed.
+
+    The ETag is derived from the body rather than from version: version
+    counts this process's writes only, so workers (and restarts) would hand
+    out different tags for the same menu, or the same tag for different
+    ones. A body hash agrees across workers and changes exactly when the
+    menu does.
+'''
+class MenuCache:
+    def __init__(self, ttl=10):
+        self.ttl = ttl
+        self.version = 0
+        self._lock = threading.Lock()
+        self._entry = None
+
+    def _fresh(self, entry):
+        return entry is not None and entry[0] == self.version and time.monotonic() < entry[1]
+
+    '''
+    get(build)
+        (body, etag) for the current menu, calling build() for the list of
+        drink.short() dicts when the cached body is stale. Both are None
+        when there are no drinks.
+    '''
+    def get(self, build):
+        entry = self._entry
+        if not self._fresh(entry):
+            with self._lock:
+                entry = self._entry
+                if not self._fresh(entry):
+                    version = self.version
+                    entry = self._render(version, build())
+        return entry[2], entry[3]
+
+    '''
+    get_async(build)
+        get() for asyncio servers, build being a coroutine function. The
+        event loop must not block on the lock, so requests arriving while
+        the menu is stale may each query the drinks once.
+    '''
+    async def get_async(self, build):
+        entry = self._entry
+        if not self._fresh(entry):
+            version = self.version
+            entry = self._render(version, await build())
+        return entry[2], entry[3]
+
+    def _render(self, version, drinks):
+        body = etag = None
+        if drinks:
+            body = json.dumps({'success': True, 'drinks': drinks}).encode()
+            etag = hashlib.sha256(body).hexdigest()[:32]
+        entry = (version, time.monotonic() + self.ttl, body, etag)
+        self._entry = entry
+        return entry
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+
+drinks_menu = MenuCache()
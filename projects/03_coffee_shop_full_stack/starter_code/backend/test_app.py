@@ -0,0 +1,412 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from jose import jwt
+from sqlalchemy import create_engine, exc, inspect
+
+import src.database.models as models
+
+# a scratch database for the whole run, set before src.api binds to it
+scratch = tempfile.mkdtemp()
+models.database_path = 'sqlite:///' + os.path.join(scratch, 'database.db')
+
+from src.api import app
+from src.asgi import app as asgi_app
+
+# setup_db ran on that import; it must not have touched the database
+TOUCHED_ON_IMPORT = os.path.exists(os.path.join(scratch, 'database.db'))
+from src.auth.auth import API_AUDIENCE, AUTH0_DOMAIN, jwks_store, verified_tokens
+from src.database.models import Drink, add_version_column
+from src.menu_cache import drinks_menu
+from fsnd_common.bench_jwt_verifier import _b64, generate_keypair
+
+PEM, N, E = generate_keypair()
+ALL_PERMISSIONS = ['get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks']
+RECIPE = [{'color': 'brown', 'name': 'coffee', 'parts': 1}]
+
+
+def jwks(*kids):
+    return {'keys': [{'kty': 'RSA', 'kid': kid, 'use': 'sig', 'n': _b64(N), 'e': _b64(E)} for kid in kids]}
+
+
+def bearer(permissions=ALL_PERMISSIONS, kid='test', sub='barista'):
+    token = jwt.encode({'sub': sub, 'aud': API_AUDIENCE, 'iss': 'https://' + AUTH0_DOMAIN + '/',
+                        'exp': int(time.time()) + 3600, 'permissions': permissions},
+                       PEM, algorithm='RS256', headers={'kid': kid})
+    return {'Authorization': 'Bearer ' + token}
+
+
+def reset():
+    # an empty drink table and a key set holding the test key
+    jwks_store.set_source(lambda: (jwks('test'), None))
+    verified_tokens.clear()
+    with app.app_context():
+        models.db_drop_and_create_all()
+    drinks_menu.invalidate()
+
+
+class CoffeeShopTestCase(unittest.TestCase):
+    """The coffee shop API on a scratch sqlite database, with tokens signed
+    by a locally generated key"""
+
+    def setUp(self):
+        reset()
+        self.client = app.test_client
+
+    def create(self, title, recipe=RECIPE):
+        res = self.client().post('/drinks', json={'title': title, 'recipe': recipe}, headers=bearer())
+        self.assertEqual(res.status_code, 200)
+        return json.loads(res.data)['drinks']
+
+    # test_create_drink
+    def test_create_drink(self):
+        drink = self.create('Latte')
+        res = self.client().get('/drinks')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['drinks'], [{'id': drink['id'], 'title': 'Latte',
+                                           'recipe': [{'color': 'brown', 'parts': 1}]}])
+
+    # test_create_drink_without_recipe
+    def test_create_drink_without_recipe(self):
+        res = self.client().post('/drinks', json={'title': 'Water'}, headers=bearer())
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(self.client().get('/drinks').status_code, 400)
+
+    # test_null_recipe_is_not_stored
+    def test_null_recipe_is_not_stored(self):
+        with app.app_context():
+            with self.assertRaises(exc.IntegrityError):
+                Drink(title='Water', recipe=None).insert()
+
+    # test_get_drinks_304
+    def test_get_drinks_304(self):
+        self.create('Latte')
+        first = self.client().get('/drinks')
+        etag = first.headers['ETag']
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+        self.assertEqual(res.headers['ETag'], etag)
+
+    # test_get_drinks_after_write
+    def test_get_drinks_after_write(self):
+        latte = self.create('Latte')
+        etag = self.client().get('/drinks').headers['ETag']
+
+        self.create('Mocha')
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+        titles = [drink['title'] for drink in json.loads(res.data)['drinks']]
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(titles, ['Latte', 'Mocha'])
+        etag = res.headers['ETag']
+
+        self.client().patch('/drinks/{}'.format(latte['id']), json={'title': 'Flat white'}, headers=bearer())
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+        titles = [drink['title'] for drink in json.loads(res.data)['drinks']]
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(titles, ['Flat white', 'Mocha'])
+        etag = res.headers['ETag']
+
+        self.client().delete('/drinks/{}'.format(latte['id']), headers=bearer())
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+        titles = [drink['title'] for drink in json.loads(res.data)['drinks']]
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(titles, ['Mocha'])
+
+    # test_patch_drink_bad_values
+    def test_patch_drink_bad_values(self):
+        latte = self.create('Latte')
+        path = '/drinks/{}'.format(latte['id'])
+        for body in ({'recipe': 'espresso, milk'}, {'recipe': [{'color': 'brown'}]},
+                     {'recipe': [{'color': 'brown', 'parts': '1'}]}, {'recipe': [['brown', 1]]},
+                     {'recipe': [{'color': 'brown', 'name': 2, 'parts': 1}]}, {'recipe': None},
+                     {'title': 7}, {'title': ''}):
+            with self.subTest(body=body):
+                res = self.client().patch(path, json=body, headers=bearer())
+                self.assertEqual(res.status_code, 400)
+
+        res = self.client().get('/drinks-detail', headers=bearer())
+        self.assertEqual(json.loads(res.data)['drinks'], [latte])
+
+    # test_patch_drink_short_recipe
+    def test_patch_drink_short_recipe(self):
+        latte = self.create('Latte')
+        recipe = [{'color': 'white', 'parts': 2.5}]
+        res = self.client().patch('/drinks/{}'.format(latte['id']), json={'recipe': recipe}, headers=bearer())
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['drinks']['recipe'], recipe)
+
+    # test_patch_drink_duplicate_title
+    def test_patch_drink_duplicate_title(self):
+        self.create('Latte')
+        mocha = self.create('Mocha')
+        res = self.client().patch('/drinks/{}'.format(mocha['id']), json={'title': 'Latte'}, headers=bearer())
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        titles = [drink['title'] for drink in json.loads(self.client().get('/drinks').data)['drinks']]
+        self.assertEqual(titles, ['Latte', 'Mocha'])
+
+    # test_create_drink_bad_recipe
+    def test_create_drink_bad_recipe(self):
+        res = self.client().post('/drinks', json={'title': 'Water', 'recipe': [{'name': 'water'}]},
+                                 headers=bearer())
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(self.client().get('/drinks').status_code, 400)
+
+    def batch(self, *operations):
+        res = self.client().post('/drinks/batch', json={'operations': list(operations)}, headers=bearer())
+        return res.status_code, json.loads(res.data)
+
+    # test_batch_repeated_drink
+    def test_batch_repeated_drink(self):
+        latte = self.create('Latte')
+        for operations in (
+                [{'op': 'update', 'id': latte['id'], 'title': 'Flat white'}, {'op': 'delete', 'id': latte['id']}],
+                [{'op': 'delete', 'id': latte['id']}, {'op': 'update', 'id': latte['id'], 'title': 'Flat white'}],
+                [{'op': 'update', 'id': latte['id'], 'title': 'Flat white'},
+                 {'op': 'create', 'title': 'Mocha', 'recipe': RECIPE},
+                 {'op': 'update', 'id': latte['id'], 'recipe': RECIPE * 2}]):
+            with self.subTest(operations=operations):
+                status, data = self.batch(*operations)
+
+                self.assertEqual(status, 422)
+                self.assertEqual(data['success'], False)
+                self.assertEqual(data['operation'], len(operations) - 1)
+
+        res = self.client().get('/drinks-detail', headers=bearer())
+        self.assertEqual(json.loads(res.data)['drinks'], [latte])
+
+    # test_batch_checks_recipes
+    def test_batch_checks_recipes(self):
+        latte = self.create('Latte')
+        short = [{'color': 'white', 'parts': 1}]
+        status, data = self.batch(
+            {'op': 'create', 'title': 'Water'},
+            {'op': 'create', 'title': 'Milk', 'recipe': None},
+            {'op': 'create', 'title': 'Tea', 'recipe': [{'color': 'green', 'name': 'tea'}]},
+            {'op': 'create', 'title': 'Cream', 'recipe': short},
+            {'op': 'update', 'id': latte['id'], 'recipe': {'color': 'brown', 'parts': 1}},
+        )
+
+        self.assertEqual(status, 200)
+        self.assertEqual([result['error'] if not result['success'] else 200 for result in data['results']],
+                         [400, 400, 400, 200, 400])
+        self.assertEqual(data['results'][3]['drinks']['recipe'], short)
+        titles = [drink['title'] for drink in json.loads(self.client().get('/drinks').data)['drinks']]
+        self.assertEqual(titles, ['Latte', 'Cream'])
+
+    # test_import_does_not_touch_database
+    def test_import_does_not_touch_database(self):
+        self.assertFalse(TOUCHED_ON_IMPORT)
+
+    # test_add_version_column
+    def test_add_version_column(self):
+        # the checked-in database predates the version column
+        checked_in = os.path.join(os.path.dirname(models.__file__), models.database_filename)
+        copy = os.path.join(scratch, 'before_versions.db')
+        shutil.copy(checked_in, copy)
+        engine = create_engine('sqlite:///' + copy)
+        engine.execute("INSERT INTO drink (title, recipe) VALUES ('Latte', '[]')")
+
+        add_version_column(engine)
+        add_version_column(engine)
+        columns = [column['name'] for column in inspect(engine).get_columns('drink')]
+        versions = [row.version for row in engine.execute('SELECT version FROM drink')]
+        engine.dispose()
+
+        self.assertEqual(columns, ['id', 'title', 'recipe', 'version'])
+        self.assertEqual(versions, [1])
+
+    # test_blank_authorization_header
+    def test_blank_authorization_header(self):
+        for header, code in ((' ', 'invalid_header'), ('', 'authorization_header_missing'),
+                             ('Bearer', 'invalid_header'), ('Bearer a b', 'invalid_header')):
+            with self.subTest(header=header):
+                res = self.client().get('/drinks-detail', headers={'Authorization': header})
+                data = json.loads(res.data)
+
+                self.assertEqual(res.status_code, 401)
+                self.assertEqual(data['code'], code)
+
+    # test_asgi_adds_version_column
+    def test_asgi_adds_version_column(self):
+        checked_in = os.path.join(os.path.dirname(models.__file__), models.database_filename)
+        copy = os.path.join(scratch, 'asgi_before_versions.db')
+        shutil.copy(checked_in, copy)
+        engine = create_engine('sqlite:///' + copy)
+        engine.execute("INSERT INTO drink (title, recipe) VALUES (?, ?)", 'Latte', json.dumps(RECIPE))
+
+        async def serve():
+            async with asgi_app.test_app() as test_app:
+                client = test_app.test_client()
+                listed = await client.get('/drinks')
+                patched = await client.patch('/drinks/1', json={'title': 'Flat white'},
+                                             headers=dict(bearer(), **{'If-Match': '"1"'}))
+                return listed.status_code, patched.status_code, await patched.get_json()
+
+        database_path, writes = models.database_path, models.writes
+        models.database_path, models.writes = 'sqlite:///' + copy, None
+        try:
+            listed, patched, data = asyncio.run(serve())
+        finally:
+            models.database_path, models.writes = database_path, writes
+            drinks_menu.invalidate()
+        versions = [row.version for row in engine.execute('SELECT version FROM drink')]
+        engine.dispose()
+
+        self.assertEqual(listed, 200)
+        self.assertEqual(patched, 200)
+        self.assertEqual(data['drinks']['version'], 2)
+        self.assertEqual(versions, [2])
+
+    # test_revoked_key_not_served_from_cache
+    def test_revoked_key_not_served_from_cache(self):
+        self.create('Latte')
+        headers = bearer(sub='regular')
+        hits = verified_tokens.stats()['hits']
+        self.assertEqual(self.client().get('/drinks-detail', headers=headers).status_code, 200)
+        self.assertEqual(self.client().get('/drinks-detail', headers=headers).status_code, 200)
+        self.assertEqual(verified_tokens.stats()['hits'], hits + 1)
+
+        jwks_store.source = lambda: (jwks('rotated'), None)
+        jwks_store.refresh()
+        res = self.client().get('/drinks-detail', headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['code'], 'invalid_header')
+        self.assertEqual(verified_tokens.stats()['size'], 0)
+        res = self.client().get('/drinks-detail', headers=bearer(kid='rotated'))
+        self.assertEqual(res.status_code, 200)
+
+    # test_menu_built_once_per_version
+    def test_menu_built_once_per_version(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            return [{'id': 1, 'title': 'Latte', 'recipe': []}]
+
+        first = drinks_menu.get(build)
+        self.assertEqual(drinks_menu.get(build), first)
+        self.assertEqual(len(builds), 1)
+        drinks_menu.invalidate()
+        self.assertEqual(drinks_menu.get(build), first)
+        self.assertEqual(len(builds), 2)
+
+
+class AsgiParityTestCase(unittest.TestCase):
+    """The same requests against api.py's Flask app and asgi.py's Quart app,
+    each starting from an empty drink table"""
+
+    def requests(self):
+        # (method, path, json body, headers)
+        barista = bearer()
+        return [
+            ('GET', '/drinks', None, {}),
+            ('POST', '/drinks', {'title': 'Latte', 'recipe': RECIPE}, barista),
+            ('POST', '/drinks', {'title': 'Latte', 'recipe': RECIPE}, barista),
+            ('POST', '/drinks', {'title': 'Water'}, barista),
+            ('GET', '/drinks', None, {}),
+            ('GET', '/drinks-detail', None, {}),
+            ('GET', '/drinks-detail', None, bearer(['post:drinks'])),
+            ('PATCH', '/drinks/1', {'title': 'Flat white'}, dict(barista, **{'If-Match': '"1"'})),
+            ('PATCH', '/drinks/1', {'title': 'Cortado'}, dict(barista, **{'If-Match': '"1"'})),
+            ('PATCH', '/drinks/1', {'title': 'Cortado'}, dict(barista, **{'If-Match': '"abc"'})),
+            ('PATCH', '/drinks/99', {'title': 'Cortado'}, barista),
+            ('PATCH', '/drinks/1', {}, barista),
+            ('POST', '/drinks/batch', {'operations': [
+                {'op': 'create', 'title': 'Mocha', 'recipe': RECIPE},
+                {'op': 'update', 'id': 1, 'recipe': RECIPE * 2, 'version': 2},
+                {'op': 'delete', 'id': 99},
+            ]}, barista),
+            ('POST', '/drinks/batch', {'operations': [{'op': 'delete', 'id': 1}]}, bearer(['post:drinks'])),
+            ('POST', '/drinks/batch', {'operations': []}, barista),
+            ('DELETE', '/drinks/1', None, barista),
+            ('DELETE', '/drinks/1', None, barista),
+            ('GET', '/drinks-detail', None, barista),
+            ('POST', '/drinks', {'title': 'Latte', 'recipe': RECIPE}, barista),
+            ('PATCH', '/drinks/3', {'title': 'Mocha'}, barista),
+            ('PATCH', '/drinks/3', {'recipe': [{'color': 'brown'}]}, barista),
+            ('PATCH', '/drinks/3', {'title': ['Mocha']}, barista),
+            ('POST', '/drinks', {'title': 'Tea', 'recipe': 'green'}, barista),
+            ('POST', '/drinks/batch', {'operations': [
+                {'op': 'update', 'id': 3, 'title': 'Cortado'},
+                {'op': 'delete', 'id': 3},
+            ]}, barista),
+            ('POST', '/drinks/batch', {'operations': [
+                {'op': 'create', 'title': 'Tea'},
+                {'op': 'update', 'id': 3, 'recipe': [{'color': 'brown', 'parts': 'some'}]},
+                {'op': 'delete', 'id': 2},
+            ]}, barista),
+        ]
+
+    @staticmethod
+    def result(status, etag, data):
+        return status, etag, json.loads(data) if data else None
+
+    def flask(self, requests):
+        reset()
+        client = app.test_client()
+        results = []
+        for method, path, body, headers in requests:
+            res = client.open(path, method=method, json=body, headers=headers)
+            results.append(self.result(res.status_code, res.headers.get('ETag'), res.data))
+        return results
+
+    async def quart(self, requests):
+        reset()
+        results = []
+        async with asgi_app.test_app() as test_app:
+            client = test_app.test_client()
+            for method, path, body, headers in requests:
+                res = await client.open(path, method=method, json=body, headers=headers)
+                results.append(self.result(res.status_code, res.headers.get('ETag'), await res.get_data()))
+        return results
+
+    # test_same_responses
+    def test_same_responses(self):
+        requests = self.requests()
+        flask = self.flask(requests)
+        quart = asyncio.run(self.quart(requests))
+
+        for request, expected, actual in zip(requests, flask, quart):
+            with self.subTest(method=request[0], path=request[1]):
+                self.assertEqual(actual, expected)
+        self.assertEqual([status for status, _, _ in flask],
+                         [400, 200, 422, 422, 200, 401, 401, 200, 412, 412, 404, 400, 200, 401, 400,
+                          200, 404, 200, 200, 422, 400, 400, 400, 422, 200])
+        self.assertEqual(flask[-2][2]['operation'], 1)
+        self.assertEqual([result['success'] for result in flask[-1][2]['results']], [False, False, True])
+        self.assertEqual(flask[7][1], '"2"')
+        self.assertEqual([result['success'] for result in flask[12][2]['results']], [True, True, False])
+
+    # test_etag_revalidation
+    def test_etag_revalidation(self):
+        requests = [('POST', '/drinks', {'title': 'Latte', 'recipe': RECIPE}, bearer()),
+                    ('GET', '/drinks', None, {})]
+        etag = self.flask(requests)[1][1]
+        requests.append(('GET', '/drinks', None, {'If-None-Match': etag}))
+
+        self.assertEqual(self.flask(requests)[2][0], 304)
+        self.assertEqual(asyncio.run(self.quart(requests))[2][0], 304)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
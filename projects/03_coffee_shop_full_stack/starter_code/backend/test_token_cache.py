@@ -0,0 +1,95 @@
+import time
+import unittest
+
+from src.auth.token_cache import VerifiedTokenCache
+
+
+class Keys:
+    """stands in for the JWKSStore the tokens were verified against"""
+
+    def __init__(self):
+        self.version = 1
+
+
+def payload(sub, exp_in=3600):
+    return {'sub': sub, 'exp': time.time() + exp_in}
+
+
+class VerifiedTokenCacheTestCase(unittest.TestCase):
+    """VerifiedTokenCache eviction, expiry and invalidation"""
+
+    def setUp(self):
+        self.keys = Keys()
+        self.cache = VerifiedTokenCache(maxsize=2, keys=self.keys)
+
+    # test_hit
+    def test_hit(self):
+        self.cache.put('token-a', payload('a'))
+
+        self.assertEqual(self.cache.get('token-a')['sub'], 'a')
+        self.assertIsNone(self.cache.get('token-b'))
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'size': 1, 'hit_rate': 0.5})
+
+    # test_keyed_by_digest
+    def test_keyed_by_digest(self):
+        self.cache.put('token-a', payload('a'))
+
+        self.assertNotIn('token-a', self.cache._entries)
+        self.assertEqual([len(key) for key in self.cache._entries], [32])
+
+    # test_evicts_least_recently_used
+    def test_evicts_least_recently_used(self):
+        self.cache.put('token-a', payload('a'))
+        self.cache.put('token-b', payload('b'))
+        self.cache.get('token-a')
+        self.cache.put('token-c', payload('c'))
+
+        self.assertEqual(self.cache.stats()['size'], 2)
+        self.assertIsNone(self.cache.get('token-b'))
+        self.assertEqual(self.cache.get('token-a')['sub'], 'a')
+        self.assertEqual(self.cache.get('token-c')['sub'], 'c')
+
+    # test_put_again_refreshes
+    def test_put_again_refreshes(self):
+        self.cache.put('token-a', payload('a'))
+        self.cache.put('token-b', payload('b'))
+        self.cache.put('token-a', payload('a'))
+        self.cache.put('token-c', payload('c'))
+
+        self.assertIsNone(self.cache.get('token-b'))
+        self.assertIsNotNone(self.cache.get('token-a'))
+
+    # test_expired_dropped
+    def test_expired_dropped(self):
+        self.cache.put('token-a', payload('a', exp_in=-1))
+
+        self.assertIsNone(self.cache.get('token-a'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    # test_without_exp_not_cached
+    def test_without_exp_not_cached(self):
+        self.cache.put('token-a', {'sub': 'a'})
+        self.cache.put('token-b', {'sub': 'b', 'exp': 'tomorrow'})
+
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    # test_key_change_empties_cache
+    def test_key_change_empties_cache(self):
+        self.cache.put('token-a', payload('a'))
+        self.keys.version += 1
+
+        self.assertIsNone(self.cache.get('token-a'))
+        self.cache.put('token-a', payload('a'))
+        self.assertIsNotNone(self.cache.get('token-a'))
+
+    # test_clear
+    def test_clear(self):
+        self.cache.put('token-a', payload('a'))
+        self.cache.clear()
+
+        self.assertIsNone(self.cache.get('token-a'))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import IntegrityError
+
+from src.database.models import Drink
+from src.database.writer import WriteQueue
+
+table = Drink.__table__
+RECIPE = [{'color': 'brown', 'name': 'coffee', 'parts': 1}]
+
+
+def insert(title):
+    return lambda connection: connection.execute(
+        table.insert().values(title=title, recipe=RECIPE)).inserted_primary_key[0]
+
+
+class WriteQueueTestCase(unittest.TestCase):
+    """WriteQueue batching, savepoints and shutdown on a scratch sqlite file"""
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        uri = 'sqlite:///' + os.path.join(self.tempdir.name, 'writes.db')
+        self.engine = create_engine(uri)
+        table.create(self.engine)
+        self.writes = WriteQueue(uri, max_batch=4)
+        self.results = {}
+
+    def tearDown(self):
+        self.writes.close()
+        self.engine.dispose()
+        self.tempdir.cleanup()
+
+    def titles(self):
+        with self.engine.connect() as connection:
+            return sorted(row.title for row in connection.execute(select([table.c.title])))
+
+    def submit(self, name, job):
+        # submits job from its own thread, recording its result or error under name
+        def run():
+            try:
+                self.results[name] = self.writes.submit(job)
+            except Exception as error:
+                self.results[name] = error
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def queued(self, *jobs):
+        # holds the writer thread on a first job until every one of jobs is
+        # queued behind it, so they are drained together; returns once all ran
+        started, release = threading.Event(), threading.Event()
+
+        def hold(connection):
+            started.set()
+            release.wait()
+        threads = [self.submit('hold', hold)]
+        started.wait()
+        for name, job in jobs:
+            threads.append(self.submit(name, job))
+        while self.writes._queue.qsize() < len(jobs):
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+    # test_submit_returns_result
+    def test_submit_returns_result(self):
+        id = self.writes.submit(insert('Latte'))
+
+        self.assertEqual(id, 1)
+        self.assertEqual(self.titles(), ['Latte'])
+        self.assertEqual((self.writes.batches, self.writes.jobs), (1, 1))
+
+    # test_queued_jobs_share_a_commit
+    def test_queued_jobs_share_a_commit(self):
+        self.queued(('a', insert('a')), ('b', insert('b')), ('c', insert('c')))
+
+        self.assertEqual(self.titles(), ['a', 'b', 'c'])
+        # the held job committed alone, the three queued behind it together
+        self.assertEqual((self.writes.batches, self.writes.jobs), (2, 4))
+
+    # test_batches_capped_at_max_batch
+    def test_batches_capped_at_max_batch(self):
+        self.queued(*((str(n), insert(str(n))) for n in range(6)))
+
+        self.assertEqual(len(self.titles()), 6)
+        self.assertEqual((self.writes.batches, self.writes.jobs), (3, 7))
+
+    # test_failing_job_rolled_back_alone
+    def test_failing_job_rolled_back_alone(self):
+        def half_done(connection):
+            connection.execute(table.insert().values(title='half', recipe=RECIPE))
+            raise ValueError('changed my mind')
+
+        self.queued(('a', insert('a')), ('duplicate', insert('a')), ('half', half_done), ('c', insert('c')))
+
+        self.assertIsInstance(self.results['duplicate'], IntegrityError)
+        self.assertIsInstance(self.results['half'], ValueError)
+        self.assertEqual(self.results['a'], 1)
+        self.assertEqual(self.titles(), ['a', 'c'])
+        self.assertEqual(self.writes.batches, 2)
+
+    # test_close_commits_queued_jobs
+    def test_close_commits_queued_jobs(self):
+        started, release = threading.Event(), threading.Event()
+
+        def hold(connection):
+            started.set()
+            release.wait()
+        threads = [self.submit('hold', hold)]
+        started.wait()
+        threads.append(self.submit('a', insert('a')))
+        while self.writes._queue.qsize() < 1:
+            time.sleep(0.001)
+        writer = self.writes._thread
+        closing = threading.Thread(target=self.writes.close)
+        closing.start()
+        release.set()
+        closing.join()
+        for thread in threads:
+            thread.join()
+
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(self.results['a'], 1)
+        self.assertEqual(self.titles(), ['a'])
+
+    # test_submit_after_close
+    def test_submit_after_close(self):
+        self.writes.submit(insert('a'))
+        self.writes.close()
+        self.writes.close()
+
+        self.assertIsNone(self.writes._thread)
+        self.assertEqual(self.writes.submit(insert('b')), 2)
+        self.assertTrue(self.writes._thread.is_alive())
+        self.assertEqual(self.titles(), ['a', 'b'])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
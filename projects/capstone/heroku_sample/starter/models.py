@@ -1,7 +1,10 @@
+import os
 from sqlalchemy import Column, String, create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from fsnd_common.database import configure_database
+
 database_path = os.environ['DATABASE_URL']
 
 db = SQLAlchemy()
@@ -11,8 +14,7 @@ setup_db(app)
     binds a flask application and a SQLAlchemy service
 '''
 def setup_db(app, database_path=database_path):
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    configure_database(app, db, database_path)
     db.app = app
     db.init_app(app)
     db.create_all()
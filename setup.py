@@ -0,0 +1,16 @@
+from setuptools import setup
+
+# fsnd_common, the helpers shared by the projects, as an installable
+# package. Each project's requirements.txt installs it in editable mode:
+#
+#     pip install -e <repository root>
+#
+# Flask, SQLAlchemy and python-jose are left to the projects, which pin
+# their own versions.
+setup(
+    name='fsnd-common',
+    version='0.1.0',
+    description="Helpers shared by the Full Stack Nanodegree projects",
+    packages=['fsnd_common'],
+    python_requires='>=3.6',
+)